@@ -0,0 +1,104 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare profile compression against the former pairwise implementation.
+
+The former implementation searched the compressed profile for every rule
+and compared permission sets pairwise; the current one groups rules by a
+precomputed key.  Run with ``python -m benchmark.compress``.
+"""
+
+import argparse
+import time
+from xml.etree import cElementTree as ElementTree
+
+from comarmor.xml.helpers import compatible_permissions, compress_profile
+
+PERMISSIONS = [
+    ['ros_publish'],
+    ['ros_subscribe'],
+    ['ros_publish', 'ros_subscribe'],
+    ['ros_call'],
+    ['ros_execute'],
+]
+
+
+def pairwise_compress_profile(profile):
+    compressed_profile = ElementTree.Element('profile')
+    compressed_profile.set('name', profile.get('name'))
+
+    for rule in list(profile):
+        compressed_rules = compressed_profile.findall(rule.tag)
+        for compressed_rule in compressed_rules:
+            if compatible_permissions(rule, compressed_rule):
+                attachments = rule.find('attachments')
+                compressed_attachments = compressed_rule.find('attachments')
+                compressed_attachments.extend(attachments)
+                break
+        else:
+            compressed_profile.append(rule)
+
+    return compressed_profile
+
+
+def make_profile(rules):
+    """Generate an uncompressed profile, one rule per endpoint as discovery does."""
+    profile = ElementTree.Element('profile')
+    profile.set('name', '/bench')
+    attachments = ElementTree.SubElement(profile, 'attachments')
+    ElementTree.SubElement(attachments, 'attachment').text = '/bench'
+    for i in range(rules):
+        permissions = PERMISSIONS[i % len(PERMISSIONS)]
+        tag = 'ros_service' if permissions[0] in ('ros_call', 'ros_execute') else 'ros_topic'
+        rule = ElementTree.SubElement(profile, tag)
+        rule.set('qualifier', 'ALLOW')
+        attachments = ElementTree.SubElement(rule, 'attachments')
+        ElementTree.SubElement(attachments, 'attachment').text = '/object_%d' % i
+        element = ElementTree.SubElement(rule, 'permissions')
+        for permission in permissions:
+            ElementTree.SubElement(element, permission)
+    return profile
+
+
+def measure(func, rules, repeat):
+    # compression moves elements, so every run needs a fresh profile
+    best = None
+    for _ in range(repeat):
+        profile = make_profile(rules)
+        start = time.perf_counter()
+        func(profile)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rules', type=int, nargs='+', default=[100, 1000, 5000, 20000],
+                        help='number of rules per generated profile')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print('%8s %14s %14s %10s' % ('rules', 'pairwise ms', 'grouped ms', 'speedup'))
+    for rules in args.rules:
+        assert ElementTree.tostring(pairwise_compress_profile(make_profile(rules))) == \
+            ElementTree.tostring(compress_profile(make_profile(rules)))
+        pairwise = measure(pairwise_compress_profile, rules, args.repeat)
+        grouped = measure(compress_profile, rules, args.repeat)
+        print('%8d %14.3f %14.3f %9.1fx' % (rules, pairwise, grouped, pairwise / grouped))
+
+
+if __name__ == '__main__':
+    main()
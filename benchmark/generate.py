@@ -0,0 +1,226 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Generate synthetic comarmor.d trees and RTI discovery dumps.
+
+The output is fully determined by the parameters and the seed, so the
+same workload can be regenerated on every commit.  Run with
+``python -m benchmark.generate``.
+"""
+
+import argparse
+import os
+import random
+from xml.sax.saxutils import escape
+
+# relay permissions are left out, comarmor.graph has no edge direction for them
+TOPIC_PERMISSIONS = ['publish', 'subscribe']
+ROS_TOPIC_PERMISSIONS = ['ros_publish', 'ros_subscribe']
+ROS_SERVICE_PERMISSIONS = ['ros_call', 'ros_execute']
+
+RULES = [
+    ('topic', TOPIC_PERMISSIONS),
+    ('ros_topic', ROS_TOPIC_PERMISSIONS),
+    ('ros_service', ROS_SERVICE_PERMISSIONS),
+]
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+XINCLUDE = 'xmlns:xi="http://www.w3.org/2001/XInclude"'
+
+
+def subject_name(index, namespaces):
+    return '/ns%d/node%d' % (index % namespaces, index)
+
+
+def object_name(rng, objects, glob_density):
+    if rng.random() >= glob_density:
+        return '/object_%d' % rng.randrange(objects)
+    return rng.choice([
+        '/object_%d*' % rng.randrange(objects // 10 or 1),
+        '/ns%d/*' % rng.randrange(10),
+        '{namespace}{name}/*',
+        '/object_?%d' % rng.randrange(10),
+    ])
+
+
+def write_rule(out, rng, indent, objects, glob_density):
+    tag, permissions = rng.choice(RULES)
+    qualifier = 'DENY' if rng.random() < 0.1 else 'ALLOW'
+    out.append('%s<%s qualifier="%s">\n' % (indent, tag, qualifier))
+    out.append('%s  <attachments>\n' % indent)
+    for _ in range(rng.randint(1, 3)):
+        out.append('%s    <attachment>%s</attachment>\n' % (
+            indent, escape(object_name(rng, objects, glob_density))))
+    out.append('%s  </attachments>\n' % indent)
+    out.append('%s  <permissions>\n' % indent)
+    # the schema requires permissions in declaration order
+    chosen = set(rng.sample(permissions, rng.randint(1, len(permissions))))
+    for permission in permissions:
+        if permission in chosen:
+            out.append('%s    <%s/>\n' % (indent, permission))
+    out.append('%s  </permissions>\n' % indent)
+    out.append('%s</%s>\n' % (indent, tag))
+
+
+def write_profile(out, rng, indent, name, attachments, depth, options):
+    out.append('%s<profile name="%s">\n' % (indent, escape(name)))
+    out.append('%s  <attachments>\n' % indent)
+    for attachment in attachments:
+        out.append('%s    <attachment>%s</attachment>\n' % (indent, escape(attachment)))
+    out.append('%s  </attachments>\n' % indent)
+    if options['include_depth'] > 0:
+        out.append('%s  <xi:include href="tunables/include_0.xml" parse="xml"/>\n' % indent)
+    for _ in range(options['rules']):
+        write_rule(out, rng, indent + '  ', options['objects'], options['glob_density'])
+    if depth < options['nested']:
+        nested = '%s/*' % attachments[0].rsplit('/', 1)[0]
+        write_profile(
+            out, rng, indent + '  ', '%s nested %d' % (name, depth), [nested], depth + 1,
+            options)
+    out.append('%s</profile>\n' % indent)
+
+
+def write_includes(directory, rng, options):
+    # include_0.xml includes include_1.xml and so on, the last one is a rule
+    tunables = os.path.join(directory, 'tunables')
+    os.makedirs(tunables, exist_ok=True)
+    depth = options['include_depth']
+    for level in range(depth):
+        out = [XML_HEADER]
+        if level == depth - 1:
+            write_rule(out, rng, '', options['objects'], options['glob_density'])
+        else:
+            out.append('<profile name="include %d" %s>\n' % (level, XINCLUDE))
+            out.append('  <attachments>\n    <attachment>/*</attachment>\n  </attachments>\n')
+            write_rule(out, rng, '  ', options['objects'], options['glob_density'])
+            out.append('  <xi:include href="include_%d.xml" parse="xml"/>\n' % (level + 1))
+            out.append('</profile>\n')
+        with open(os.path.join(tunables, 'include_%d.xml' % level), 'w') as f:
+            f.write(''.join(out))
+
+
+def generate_profiles(
+        directory, profiles=100, files=10, nested=1, rules=20, objects=1000,
+        glob_density=0.2, include_depth=2, namespaces=10, seed=0):
+    """
+    Write a synthetic comarmor.d tree.
+
+    :param directory: directory to write the profile files into
+    :param profiles: number of top level profiles
+    :param files: number of profile files the profiles are spread across
+    :param nested: depth of nested profiles within every profile
+    :param rules: number of rules per profile
+    :param objects: number of distinct object names
+    :param glob_density: fraction of object attachments using wildcards
+    :param include_depth: depth of the XInclude chain included by every
+    profile, 0 for none
+    :param namespaces: number of subject namespaces
+    :param seed: seed of the random generator
+    :returns: list of the subject names the profiles are attached to
+    """
+    rng = random.Random(seed)
+    options = {
+        'nested': nested,
+        'rules': rules,
+        'objects': objects,
+        'glob_density': glob_density,
+        'include_depth': include_depth,
+    }
+    os.makedirs(directory, exist_ok=True)
+    if include_depth > 0:
+        write_includes(directory, rng, options)
+    files = max(1, min(files, profiles))
+    subjects = []
+    for file_index in range(files):
+        out = [XML_HEADER, '<profiles %s>\n' % XINCLUDE]
+        for index in range(file_index, profiles, files):
+            subject = subject_name(index, namespaces)
+            subjects.append(subject)
+            write_profile(out, rng, '  ', 'profile %d' % index, [subject], 0, options)
+        out.append('</profiles>\n')
+        with open(os.path.join(directory, 'profiles_%04d.xml' % file_index), 'w') as f:
+            f.write(''.join(out))
+    return subjects
+
+
+def generate_discovery(path, participants=100, endpoints=10, topics=200, seed=0):
+    """
+    Write a synthetic RTI discovery dump.
+
+    :param path: file to write
+    :param participants: number of domain participants
+    :param endpoints: maximum number of publications and of subscriptions
+    per participant
+    :param topics: number of distinct topics and services
+    :param seed: seed of the random generator
+    """
+    rng = random.Random(seed)
+    out = ['<discovery>\n<processes><value>\n']
+    per_process = 5
+    for process in range(0, participants, per_process):
+        out.append('<element><host_name>host%d</host_name>' % process)
+        out.append('<domain_participants><value>\n')
+        for index in range(process, min(process + per_process, participants)):
+            out.append(
+                '<element><participant_data><participant_name><name>node%d</name>'
+                '</participant_name></participant_data>\n' % rng.randrange(participants))
+            for kind, data in (
+                    ('publications', 'publication_data'),
+                    ('subscriptions', 'subscription_data')):
+                out.append('<%s><value>' % kind)
+                for _ in range(rng.randint(0, endpoints)):
+                    topic = rng.randrange(topics)
+                    topic_name = rng.choice([
+                        'rt/topic_%d' % topic,
+                        'rq/service_%dRequest' % topic,
+                        'rr/service_%dReply' % topic,
+                    ])
+                    out.append(
+                        '<element><%s><topic_name>%s</topic_name>'
+                        '<type_name>type</type_name></%s></element>' % (data, topic_name, data))
+                out.append('</value></%s>\n' % kind)
+            out.append('</element>\n')
+        out.append('</value></domain_participants></element>\n')
+    out.append('</value></processes>\n</discovery>\n')
+    with open(path, 'w') as f:
+        f.write(''.join(out))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('directory', help='directory to write the workload into')
+    parser.add_argument('--profiles', type=int, default=100)
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--nested', type=int, default=1)
+    parser.add_argument('--rules', type=int, default=20)
+    parser.add_argument('--objects', type=int, default=1000)
+    parser.add_argument('--glob-density', type=float, default=0.2)
+    parser.add_argument('--include-depth', type=int, default=2)
+    parser.add_argument('--participants', type=int, default=100)
+    parser.add_argument('--endpoints', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    generate_profiles(
+        os.path.join(args.directory, 'comarmor.d'), profiles=args.profiles,
+        files=args.files, nested=args.nested, rules=args.rules, objects=args.objects,
+        glob_density=args.glob_density, include_depth=args.include_depth, seed=args.seed)
+    generate_discovery(
+        os.path.join(args.directory, 'discovery.xml'), participants=args.participants,
+        endpoints=args.endpoints, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
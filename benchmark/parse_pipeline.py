@@ -0,0 +1,85 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare the whitespace normalization step of the profile parse pipeline.
+
+The former pipeline serialized every expanded profile, pretty-printed it
+with minidom and parsed the result again; the current one normalizes the
+tree in place.  Run with ``python -m benchmark.parse_pipeline``.
+"""
+
+import argparse
+import timeit
+import tracemalloc
+from xml.etree import cElementTree as ElementTree
+
+from comarmor.xml import utils
+
+
+def make_profile(rules):
+    xml = ['<profiles>\n  <profile name="bench">\n    <attachments>\n'
+           '      <attachment>/bench</attachment>\n    </attachments>\n']
+    for i in range(rules):
+        xml.append(
+            '    <topic qualifier="ALLOW">\n'
+            '      <attachments><attachment>/topic_%d</attachment></attachments>\n'
+            '      <permissions><publish/><subscribe/></permissions>\n'
+            '    </topic>\n' % i)
+    xml.append('  </profile>\n</profiles>\n')
+    return ''.join(xml)
+
+
+def roundtrip(data):
+    root = ElementTree.fromstring(data)
+    return ElementTree.fromstring(utils.beautify_xml(root))
+
+
+def single_pass(data):
+    root = ElementTree.fromstring(data)
+    return utils.normalize_xml(root)
+
+
+def peak_memory(func, data):
+    tracemalloc.start()
+    func(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rules', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help='number of rules per generated profile')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print('%8s %14s %14s %14s %14s' % (
+        'rules', 'roundtrip ms', 'single ms', 'roundtrip KiB', 'single KiB'))
+    for rules in args.rules:
+        data = make_profile(rules)
+        assert ElementTree.tostring(roundtrip(data)) == ElementTree.tostring(single_pass(data))
+        number = max(1, 2000 // rules)
+        times = []
+        for func in (roundtrip, single_pass):
+            best = min(timeit.repeat(lambda: func(data), number=number, repeat=args.repeat))
+            times.append(best / number * 1000)
+        # parsing the input is common to both, only the difference matters
+        memory = [peak_memory(func, data) / 1024 for func in (roundtrip, single_pass)]
+        print('%8d %14.3f %14.3f %14.1f %14.1f' % ((rules,) + tuple(times) + tuple(memory)))
+
+
+if __name__ == '__main__':
+    main()
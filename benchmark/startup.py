@@ -0,0 +1,87 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measure the startup and first parse time of short-lived processes.
+
+Every sample runs a fresh interpreter, so module imports and the schema
+build are included.  Pass ``--pythonpath`` several times to compare
+checkouts.  Run with ``python -m benchmark.startup``.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS = {
+    'interpreter': 'pass',
+    'import': 'import comarmor',
+    'first parse': 'import comarmor; comarmor.parse_profiles(%r)',
+}
+
+
+def make_profile(path):
+    with open(path, 'w') as f:
+        f.write(
+            '<profiles>\n  <profile name="bench">\n    <attachments>\n'
+            '      <attachment>/bench</attachment>\n    </attachments>\n'
+            '    <topic qualifier="ALLOW">\n'
+            '      <attachments><attachment>/chatter</attachment></attachments>\n'
+            '      <permissions><publish/></permissions>\n'
+            '    </topic>\n  </profile>\n</profiles>\n')
+
+
+def measure(script, pythonpath, repeat):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [pythonpath, env.get('PYTHONPATH')]))
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        # run from the checkout, '-c' puts the working directory first on sys.path
+        subprocess.run([sys.executable, '-c', script], env=env, check=True, cwd=pythonpath)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pythonpath', action='append',
+                        help='checkout to import comarmor from, default the current one')
+    parser.add_argument('--profile', help='profile file or directory to parse')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    pythonpaths = args.pythonpath or [
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+    with tempfile.TemporaryDirectory() as directory:
+        profile = args.profile
+        if profile is None:
+            profile = os.path.join(directory, 'bench.xml')
+            make_profile(profile)
+
+        print('%-40s %14s %14s %14s' % (('pythonpath',) + tuple('%s ms' % s for s in SCRIPTS)))
+        for pythonpath in pythonpaths:
+            times = [
+                measure(script % ([profile],) if '%' in script else script, pythonpath,
+                        args.repeat)
+                for script in SCRIPTS.values()]
+            print('%-40s %14.1f %14.1f %14.1f' % ((pythonpath[-40:],) + tuple(times)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Time the profile pipeline on a synthetic workload.
+
+Results are saved as JSON named after the current commit, so runs on
+different commits can be compared with ``--compare``.  Run with
+``python -m benchmark.suite``.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from xml.etree import cElementTree as ElementTree
+
+from benchmark import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_commit():
+    """Return the commit of the checkout, suffixed with -dirty if modified."""
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+        status = subprocess.check_output(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + '-dirty' if status else commit
+
+
+def measure(func, setup=None, repeat=5):
+    """Return the best time of func in milliseconds, setup is not timed."""
+    best = None
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def build_discovery_profiles(discovery):
+    """
+    Build the uncompressed profiles get_profile_from_discovery compresses.
+
+    Only uses functions available since the first release, so the suite
+    runs against any commit.
+    """
+    from comarmor.transport.dds.rti.utils import get_profile, set_attachments, set_rules
+    profiles = ElementTree.Element('profiles')
+    for domain_participant in discovery.findall(
+            'processes/value/element/domain_participants/value/element'):
+        subject_name = '/' + domain_participant.findtext(
+            'participant_data/participant_name/name')
+        profile = get_profile(profiles, subject_name)
+        set_attachments(profile, subject_name)
+        set_rules(profile, domain_participant.findall(
+            'publications/value/element/publication_data'), 'publication', 'ALLOW')
+        set_rules(profile, domain_participant.findall(
+            'subscriptions/value/element/subscription_data'), 'subscription', 'ALLOW')
+    return profiles
+
+
+def run(directory, subjects, repeat):
+    import comarmor
+    from comarmor.transport.dds.rti.utils import get_profile_from_discovery
+    from comarmor.xml.helpers import compress_profiles
+
+    profiles_path = os.path.join(directory, 'comarmor.d')
+    discovery_path = os.path.join(directory, 'discovery.xml')
+    results = {}
+
+    results['parse_profiles'] = measure(
+        lambda: comarmor.parse_profiles([profiles_path]), repeat=repeat)
+    storage = comarmor.parse_profiles([profiles_path])
+
+    results['filter_profile'] = measure(
+        lambda: [storage.filter_profile(subject) for subject in subjects], repeat=repeat)
+    results['extract_rules'] = measure(
+        lambda: [storage.extract_rules(kind) for kind in ('topic', 'ros_topic', 'ros_service')],
+        repeat=repeat)
+
+    try:
+        import networkx as nx
+    except ImportError:
+        print('networkx is not installed, skipping the graph benchmarks', file=sys.stderr)
+    else:
+        from comarmor.graph.utils import add_edges_from_profile, check_edges_from_profile
+
+        def add_edges(G):
+            for profile in storage:
+                add_edges_from_profile(profile, G)
+            return G
+
+        results['add_edges_from_profile'] = measure(
+            add_edges, setup=lambda: (nx.MultiDiGraph(),), repeat=repeat)
+        G = add_edges(nx.MultiDiGraph())
+        results['check_edges_from_profile'] = measure(
+            lambda: check_edges_from_profile(storage, G), repeat=repeat)
+
+    discovery = ElementTree.parse(discovery_path).getroot()
+    results['get_profile_from_discovery'] = measure(
+        lambda: get_profile_from_discovery(discovery), repeat=repeat)
+
+    def uncompressed():
+        return (build_discovery_profiles(discovery),)
+
+    results['compress_profiles'] = measure(compress_profiles, setup=uncompressed, repeat=repeat)
+    return results
+
+
+def load(results_dir, reference):
+    path = reference
+    if not os.path.isfile(path):
+        path = os.path.join(results_dir, reference + '.json')
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare(current, reference):
+    print('%-28s %12s %12s %8s' % (
+        'benchmark', reference['commit'][:12], current['commit'][:12], 'ratio'))
+    for name, value in current['results'].items():
+        before = reference['results'].get(name)
+        if before is None:
+            print('%-28s %12s %12.2f' % (name, '-', value))
+        else:
+            print('%-28s %12.2f %12.2f %7.2fx' % (name, before, value, value / before))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--profiles', type=int, default=200)
+    parser.add_argument('--nested', type=int, default=1)
+    parser.add_argument('--rules', type=int, default=20)
+    parser.add_argument('--glob-density', type=float, default=0.2)
+    parser.add_argument('--include-depth', type=int, default=2)
+    parser.add_argument('--participants', type=int, default=500)
+    parser.add_argument('--subjects', type=int, default=100,
+                        help='number of subjects filter_profile is timed for')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--results-dir', default=os.path.join(ROOT, '.benchmarks'),
+                        help='directory the results are saved to')
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--compare', metavar='COMMIT',
+                        help='commit or result file to compare against')
+    args = parser.parse_args(argv)
+
+    params = {
+        'profiles': args.profiles,
+        'nested': args.nested,
+        'rules': args.rules,
+        'glob_density': args.glob_density,
+        'include_depth': args.include_depth,
+        'participants': args.participants,
+        'subjects': args.subjects,
+        'seed': args.seed,
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        subjects = generate.generate_profiles(
+            os.path.join(directory, 'comarmor.d'), profiles=args.profiles,
+            nested=args.nested, rules=args.rules, glob_density=args.glob_density,
+            include_depth=args.include_depth, seed=args.seed)
+        generate.generate_discovery(
+            os.path.join(directory, 'discovery.xml'), participants=args.participants,
+            seed=args.seed)
+        results = run(directory, subjects[:args.subjects], args.repeat)
+
+    current = {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'params': params,
+        'results': results,
+    }
+    if args.compare:
+        reference = load(args.results_dir, args.compare)
+        if reference['params'] != params:
+            print('warning: the reference was run with different parameters', file=sys.stderr)
+        compare(current, reference)
+    else:
+        for name, value in results.items():
+            print('%-28s %12.2f ms' % (name, value))
+    if not args.no_save:
+        os.makedirs(args.results_dir, exist_ok=True)
+        path = os.path.join(args.results_dir, current['commit'] + '.json')
+        with open(path, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+        print('saved %s' % path)
+
+
+if __name__ == '__main__':
+    main()
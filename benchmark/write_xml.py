@@ -0,0 +1,92 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare the streaming XML writer against pretty printing with minidom.
+
+Profiles are generated from synthetic discovery dumps and written to a
+file, reporting the time and the peak of memory allocated while writing.
+Run with ``python -m benchmark.write_xml``.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from xml.etree import cElementTree as ElementTree
+
+from benchmark import generate
+from comarmor.transport.dds.rti.utils import get_profile_from_discovery
+from comarmor.xml import utils
+
+
+def write_minidom(element, path):
+    with open(path, 'w') as f:
+        f.write(utils._minidom_pretty_xml(element))
+
+
+def write_streaming(element, path):
+    with open(path, 'w') as f:
+        utils.write_xml(element, f)
+
+
+def measure(func, element, path, repeat):
+    """Return the best time in milliseconds and the allocation peak in KiB."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(element, path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        func(element, path)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best * 1000, peak / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--participants', type=int, nargs='+', default=[100, 1000, 5000],
+                        help='number of domain participants per generated dump')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print('%12s %12s %12s %14s %14s' % (
+        'participants', 'minidom ms', 'stream ms', 'minidom KiB', 'stream KiB'))
+    with tempfile.TemporaryDirectory() as directory:
+        discovery_path = os.path.join(directory, 'discovery.xml')
+        minidom_path = os.path.join(directory, 'minidom.xml')
+        streaming_path = os.path.join(directory, 'streaming.xml')
+        for participants in args.participants:
+            generate.generate_discovery(
+                discovery_path, participants=participants, seed=args.seed)
+            discovery = ElementTree.parse(discovery_path).getroot()
+            profiles = get_profile_from_discovery(discovery)
+            minidom_time, minidom_peak = measure(
+                write_minidom, profiles, minidom_path, args.repeat)
+            streaming_time, streaming_peak = measure(
+                write_streaming, profiles, streaming_path, args.repeat)
+            with open(minidom_path, 'rb') as a, open(streaming_path, 'rb') as b:
+                assert a.read() == b.read()
+            print('%12d %12.3f %12.3f %14.1f %14.1f' % (
+                participants, minidom_time, streaming_time, minidom_peak, streaming_peak))
+
+
+if __name__ == '__main__':
+    main()
@@ -14,37 +14,69 @@
 
 """Library for parsing comarmor profiles and providing an object representation."""
 
-# set version number
-try:
-    import pkg_resources
-    try:
-        __version__ = pkg_resources.require('comarmor')[0].version
-    except pkg_resources.DistributionNotFound:
-        __version__ = 'unset'
-    finally:
-        del pkg_resources
-except ImportError:
-    __version__ = 'unset'
-
 import os
 from xml.etree import cElementTree as ElementTree
 
-import xmlschema
-
+from . import stats
 from .xml import ElementInclude
 
 
-def parse_profiles(paths):
+def _get_version():
+    try:
+        from importlib import metadata
+    except ImportError:
+        try:
+            import pkg_resources
+        except ImportError:
+            return 'unset'
+        try:
+            return pkg_resources.require('comarmor')[0].version
+        except pkg_resources.DistributionNotFound:
+            return 'unset'
+    try:
+        return metadata.version('comarmor')
+    except metadata.PackageNotFoundError:
+        return 'unset'
+
+
+def __getattr__(name):
+    # the version number is looked up on first access, keeping imports fast
+    if name == '__version__':
+        global __version__
+        __version__ = _get_version()
+        return __version__
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
+
+
+def parse_profiles(paths, cache=None, jobs=None, fast_validation=True):
     """
     Parse profile from path.
 
     :param path: The path of the comarmor profile, it may or may not
     include a filename
+    :param cache: optional :class:`comarmor.cache.ProfileCache` used to
+    skip parsing and validation of unchanged profiles
+    :param jobs: number of worker processes used to parse profiles,
+    ``None`` to parse in the calling process, ``0`` for one per CPU
+    :param fast_validation: validate with the specialized checks of
+    :mod:`comarmor.validation` first, ``False`` to always use xmlschema
 
     :returns: return :class:`ProfileStorage` instance, populated with parsed profiles
     :raises: :exc:`InvalidProfile`
     :raises: :exc:`IOError`
     """
+    return parse_profile_paths(
+        find_profile_paths(paths), cache=cache, jobs=jobs, fast_validation=fast_validation)
+
+
+def find_profile_paths(paths):
+    """
+    Expand profile files and directories into profile file paths.
+
+    :param paths: paths of comarmor profile files or directories
+    :returns: list of paths to profiles
+    :raises: :exc:`IOError`
+    """
     profile_paths = []
     for path in paths:
         if os.path.isfile(path):
@@ -58,7 +90,7 @@ def parse_profiles(paths):
         else:
             raise IOError("Path '%s' is neither a directory nor a file" % (path))
 
-    return parse_profile_paths(profile_paths)
+    return profile_paths
 
 
 def profiles_in(path):
@@ -79,53 +111,148 @@ def profiles_in(path):
 
 
 def check_schema(schema, data, filename=None):
+    """
+    Validate data against schema in a single pass.
+
+    :raises: :exc:`InvalidProfile` listing all validation errors
+    """
     from .exceptions import InvalidProfile
-    if not schema.is_valid(data):
-        try:
-            schema.validate(data)
-        except Exception as ex:
-            if filename is not None:
-                msg = "The manifest '%s' contains invalid XML:\n" % filename
-            else:
-                msg = 'The manifest contains invalid XML:\n'
-            raise InvalidProfile(msg + str(ex))
+    try:
+        errors = list(schema.iter_errors(data))
+    except Exception as ex:
+        errors = [ex]
+    if errors:
+        if filename is not None:
+            msg = "The manifest '%s' contains invalid XML:\n" % filename
+        else:
+            msg = 'The manifest contains invalid XML:\n'
+        raise InvalidProfile(msg + '\n\n'.join(str(error) for error in errors))
+
 
+def check_profile_schema(data, filename=None, fast=True):
+    """
+    Validate a profile tree against the profile schema.
 
-def parse_profile_paths(paths):
+    :param fast: first try the specialized checks of
+    :mod:`comarmor.validation`, falling back to the generic schema
+    validation for anything they do not prove valid
+    :raises: :exc:`InvalidProfile` listing all validation errors
+    """
+    from .schemas import get_profile_schema, get_profile_schema_path
+    if fast:
+        from . import validation
+        if validation.is_schema_supported(get_profile_schema_path('comarmor_profile.xsd')) \
+                and validation.is_valid_profile(data):
+            stats.count('parse.fast_validations')
+            return
+    check_schema(get_profile_schema(), data, filename=filename)
+
+
+class _ProfileParser:
+    """Parse a single profile file, validating it against the cached schema."""
+
+    def __init__(self, cache=None, fast_validation=True):
+        self.cache = cache
+        self.fast_validation = fast_validation
+        self.include_cache = ElementInclude.IncludeCache()
+
+    def __call__(self, path, dependencies=None):
+        """
+        Parse and validate a profile file.
+
+        :param dependencies: optional set, updated with the paths of all
+        files included by the profile, also when parsing fails
+        """
+        from .profile import Profile
+        from .xml import utils
+        from .exceptions import InvalidProfile
+
+        cache = self.cache
+        if dependencies is None:
+            dependencies = set()
+        profile_tree = None
+        if cache is not None:
+            with stats.stage('parse.cache', path):
+                profile_tree = cache.get(path, dependencies)
+            stats.count('parse.cache_hits' if profile_tree is not None else 'parse.cache_misses')
+        if profile_tree is None:
+            try:
+                # simplify this xinclude workarround
+                # https://bugs.python.org/issue20928
+                with stats.stage('parse.read', path):
+                    root = ElementTree.parse(path).getroot()
+                with stats.stage('parse.include', path):
+                    depth = ElementInclude.include(
+                        root, base_url=path, dependencies=dependencies, cache=self.include_cache)
+                stats.count('parse.included_files', len(dependencies))
+                stats.maximum('parse.include_depth', depth)
+                with stats.stage('parse.normalize', path):
+                    data = utils.normalize_xml(root)
+
+                with stats.stage('parse.validate', path):
+                    check_profile_schema(data, filename=path, fast=self.fast_validation)
+                profile_tree = ElementTree.ElementTree(data)
+            except InvalidProfile as e:
+                e.args = [
+                    "Invalid profile manifest '%s': %s" %
+                    (path, e)]
+                raise
+            if cache is not None:
+                cache.store(path, profile_tree, dependencies)
+        with stats.stage('parse.profile', path):
+            profile = Profile(path=path, tree=profile_tree)
+        stats.count('parse.files')
+        return profile
+
+
+# parser of the current worker process, see _init_worker
+_worker_parser = None
+
+
+def _init_worker(parser):
+    global _worker_parser
+    _worker_parser = parser
+
+
+def _parse_in_worker(path):
+    return _worker_parser(path)
+
+
+def parse_profile_paths(paths, cache=None, jobs=None, fast_validation=True):
     """
     Parse profiles from paths.
 
     :param paths: full file paths for profiles, ``[str]``
+    :param cache: optional :class:`comarmor.cache.ProfileCache` used to
+    skip parsing and validation of unchanged profiles
+    :param jobs: number of worker processes used to parse profiles,
+    ``None`` to parse in the calling process, ``0`` for one per CPU
+    :param fast_validation: validate with the specialized checks of
+    :mod:`comarmor.validation` first, ``False`` to always use xmlschema
     :returns: return parsed :class:`ProfileStorage`
     :raises: :exc:`InvalidProfile`
     """
-    from .profile import Profile, ProfileStorage
-    from .schemas import get_profile_schema_path
-    from .xml import utils
-    from .exceptions import InvalidProfile
+    from .profile import ProfileStorage
 
-    profile_xsd_path = get_profile_schema_path('comarmor_profile.xsd')
-    profile_schema = xmlschema.XMLSchema(profile_xsd_path)
+    paths = list(paths)
+    parser = _ProfileParser(cache=cache, fast_validation=fast_validation)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
 
     profile_storage = ProfileStorage()
 
-    for path in paths:
-        try:
-            # simplify this xinclude workarround
-            # https://bugs.python.org/issue20928
-            root = ElementTree.parse(path).getroot()
-            ElementInclude.include(root, base_url=path)
-            clean_root = utils.beautify_xml(root)
-            data = ElementTree.fromstring(clean_root)
-
-            check_schema(profile_schema, data, filename=path)
-            profile_tree = ElementTree.ElementTree(data)
-        except InvalidProfile as e:
-            e.args = [
-                "Invalid profile manifest '%s': %s" %
-                (path, e)]
-            raise
-        profile = Profile(path=path, tree=profile_tree)
-        profile_storage.append(profile)
+    if jobs is None or jobs < 2 or len(paths) < 2:
+        for path in paths:
+            profile_storage.append(parser(path))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        jobs = min(jobs, len(paths))
+        chunksize = max(1, len(paths) // (jobs * 4))
+        with ProcessPoolExecutor(
+                max_workers=jobs, initializer=_init_worker, initargs=(parser,)) as executor:
+            # map yields in submission order, so the storage order and the
+            # first error raised match the serial path
+            for profile in executor.map(_parse_in_worker, paths, chunksize=chunksize):
+                profile_storage.append(profile)
 
     return profile_storage
@@ -0,0 +1,379 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Binary compiled policy files.
+
+:func:`write_policy` stores the tables of a compiled :class:`Policy` in a
+versioned little-endian file, which :func:`load_policy` maps read-only,
+so processes loading the same file share one page cache copy and never
+parse XML. The file holds the following sections, each a table of fixed
+size records, in this order:
+
+* strings: ``(offset, length)`` of UTF-8 data in the string blob
+* permissions: string index of the permission of every bit
+* patterns: string index of the attachment expression and of its
+  translated regex, or ``NONE`` if it contains placeholders
+* attachments: pattern index, referenced by ranges from profiles and rules
+* profiles: parent profile, attachment range and rule range
+* rules: profile, kind and qualifier string, permission bitmask and
+  attachment range, grouped by profile
+
+Records are decoded with :mod:`struct` when they are used, only the
+profile table is read at load time. The header and section bounds are
+checked at load time, record indices when records are decoded.
+"""
+
+from collections import OrderedDict
+import fnmatch
+import mmap
+import os
+import re
+import struct
+import tempfile
+
+from .model import PERMISSIONS
+from .policy import compile_policy, DEFAULT_CACHE_SIZE, Policy
+
+MAGIC = b'COMARMOR'
+FORMAT_VERSION = 1
+NONE = 0xFFFFFFFF
+
+# magic, version, reserved, (offset, count) of the sections, string blob offset
+HEADER = struct.Struct('<8sHH12II')
+STRING = struct.Struct('<II')
+PERMISSION = struct.Struct('<I')
+PATTERN = struct.Struct('<II')
+ATTACHMENT = struct.Struct('<I')
+PROFILE = struct.Struct('<iIIII')
+RULE = struct.Struct('<IIIIII')
+
+SECTIONS = ['strings', 'permissions', 'patterns', 'attachments', 'profiles', 'rules']
+RECORDS = [STRING, PERMISSION, PATTERN, ATTACHMENT, PROFILE, RULE]
+
+
+def _file_stamp(stat):
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def _has_placeholders(pattern):
+    return '{' in pattern or '}' in pattern
+
+
+class _Tables:
+    """Tables of a policy file being written."""
+
+    def __init__(self):
+        self.strings = {}
+        self.permissions = {}
+        self.patterns = {}
+        self.attachments = []
+        self.profiles = []
+        self.rules = []
+
+    def string(self, text):
+        return self.strings.setdefault(text, len(self.strings))
+
+    def permission(self, tag):
+        index = self.permissions.get(tag)
+        if index is None:
+            index = len(self.permissions)
+            if index == 32:
+                raise ValueError('A policy file holds at most 32 distinct permissions')
+            self.permissions[tag] = index
+        return 1 << index
+
+    def pattern(self, pattern):
+        index = self.patterns.get(pattern)
+        if index is None:
+            regex = NONE if _has_placeholders(pattern) else \
+                self.string(fnmatch.translate(pattern))
+            index = len(self.patterns)
+            self.patterns[pattern] = (index, self.string(pattern), regex)
+            return index
+        return index[0]
+
+    def attachment_range(self, patterns):
+        start = len(self.attachments)
+        self.attachments.extend(self.pattern(pattern) for pattern in patterns)
+        return start, len(patterns)
+
+
+def dump_policy(policy):
+    """
+    Serialize a compiled policy.
+
+    :param policy: :class:`comarmor.policy.Policy` to serialize
+    :returns: the content of a policy file, ``bytes``
+    """
+    tables = _Tables()
+    for permission in PERMISSIONS:
+        tables.permission(permission)
+    rules = {}
+    for rule in policy.rules:
+        rules.setdefault(rule[0], []).append(rule)
+    for index, (parent, patterns) in enumerate(policy.profiles):
+        attachment_start, attachment_count = tables.attachment_range(patterns)
+        rule_start = len(tables.rules)
+        for _, kind, qualifier, permissions, patterns in rules.get(index, []):
+            mask = 0
+            for permission in sorted(permissions):
+                mask |= tables.permission(permission)
+            tables.rules.append((
+                index, tables.string(kind), tables.string(qualifier), mask) +
+                tables.attachment_range(patterns))
+        tables.profiles.append((
+            parent, attachment_start, attachment_count,
+            rule_start, len(tables.rules) - rule_start))
+
+    permissions = [(tables.string(tag),) for tag in tables.permissions]
+    blob = []
+    strings = []
+    offset = 0
+    for text in tables.strings:
+        data = text.encode('utf-8')
+        strings.append((offset, len(data)))
+        blob.append(data)
+        offset += len(data)
+    sections = [
+        (STRING, strings),
+        (PERMISSION, permissions),
+        (PATTERN, [entry[1:] for entry in tables.patterns.values()]),
+        (ATTACHMENT, [(index,) for index in tables.attachments]),
+        (PROFILE, tables.profiles),
+        (RULE, tables.rules),
+    ]
+
+    body = []
+    header = []
+    position = HEADER.size
+    for record, entries in sections:
+        header.extend((position, len(entries)))
+        data = b''.join(record.pack(*entry) for entry in entries)
+        body.append(data)
+        position += len(data)
+    header.append(position)
+    return b''.join(
+        [HEADER.pack(MAGIC, FORMAT_VERSION, 0, *header)] + body + blob)
+
+
+def write_policy(storage, path):
+    """
+    Compile profiles into a policy file.
+
+    :param storage: :class:`comarmor.profile.ProfileStorage` to compile,
+    or an already compiled :class:`comarmor.policy.Policy`
+    :param path: file to write, replaced atomically
+    """
+    policy = storage if isinstance(storage, Policy) else compile_policy(storage)
+    data = dump_policy(policy)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class _RuleTable:
+    """Read-only sequence of the rule tuples of a policy file, decoded on access."""
+
+    __slots__ = [
+        'policy',
+    ]
+
+    def __init__(self, policy):
+        self.policy = policy
+
+    def __len__(self):
+        return self.policy._sections['rules'][1]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('rule index out of range')
+        return self.policy._rule(index)
+
+
+class MappedPolicy(Policy):
+    """
+    :class:`comarmor.policy.Policy` backed by a memory mapped policy file.
+
+    Strings, patterns and rules are decoded on first use; subject tables
+    only decode the rules of the applicable profiles.
+    """
+
+    __slots__ = [
+        '_path',
+        '_stamp',
+        '_buffer',
+        '_sections',
+        '_blob',
+        '_strings',
+        '_permissions',
+        '_regexes',
+    ]
+
+    def __init__(self, buffer, cache_size=DEFAULT_CACHE_SIZE, path=None, stamp=None):
+        if len(buffer) < HEADER.size:
+            raise ValueError('Not a comarmor policy file')
+        header = HEADER.unpack_from(buffer, 0)
+        if header[0] != MAGIC:
+            raise ValueError('Not a comarmor policy file')
+        if header[1] != FORMAT_VERSION:
+            raise ValueError('Unsupported policy file version %d' % header[1])
+        self._path = path
+        self._stamp = stamp
+        self._buffer = buffer
+        self._sections = {
+            name: (header[3 + 2 * index], header[4 + 2 * index])
+            for index, name in enumerate(SECTIONS)}
+        self._blob = header[-1]
+        self._check_bounds()
+        self._strings = {}
+        self._regexes = {}
+        self._permissions = [
+            self._string(self._record(PERMISSION, 'permissions', index)[0])
+            for index in range(self._sections['permissions'][1])]
+
+        profiles = []
+        for index in range(self._sections['profiles'][1]):
+            parent, attachment_start, attachment_count, _, _ = self._record(
+                PROFILE, 'profiles', index)
+            if not -1 <= parent < index:
+                raise ValueError('Corrupt policy file')
+            profiles.append((parent, self._patterns(attachment_start, attachment_count)))
+        self.profiles = tuple(profiles)
+        self.rules = _RuleTable(self)
+        self.cache_size = cache_size
+        self._profile_matcher = self._match_profiles()
+        self._subjects = OrderedDict()
+
+    def __reduce__(self):
+        # processes map the file themselves instead of copying the tables,
+        # refusing to when it was replaced since it was loaded here
+        if self._path is None:
+            raise TypeError('Only policies loaded from a file can be pickled')
+        return _load_policy, (self._path, self.cache_size, self._stamp)
+
+    def _check_bounds(self):
+        # sections follow the header in order and precede the string blob
+        position = HEADER.size
+        for name, record in zip(SECTIONS, RECORDS):
+            offset, count = self._sections[name]
+            if offset != position:
+                raise ValueError('Corrupt policy file')
+            position += record.size * count
+        if position != self._blob or self._blob > len(self._buffer):
+            raise ValueError('Corrupt policy file')
+        count = self._sections['strings'][1]
+        if count:
+            # strings are stored in blob order, the last one ends the file
+            offset, length = STRING.unpack_from(
+                self._buffer, self._sections['strings'][0] + STRING.size * (count - 1))
+            if self._blob + offset + length != len(self._buffer):
+                raise ValueError('Corrupt policy file')
+
+    def _record(self, record, section, index):
+        offset, count = self._sections[section]
+        if not 0 <= index < count:
+            raise ValueError('Corrupt policy file')
+        return record.unpack_from(self._buffer, offset + record.size * index)
+
+    def _string(self, index):
+        text = self._strings.get(index)
+        if text is None:
+            offset, length = self._record(STRING, 'strings', index)
+            start = self._blob + offset
+            if start + length > len(self._buffer):
+                raise ValueError('Corrupt policy file')
+            text = bytes(self._buffer[start:start + length]).decode('utf-8')
+            self._strings[index] = text
+        return text
+
+    def _pattern(self, index):
+        pattern, regex = self._record(PATTERN, 'patterns', index)
+        pattern = self._string(pattern)
+        if regex != NONE and pattern not in self._regexes:
+            self._regexes[pattern] = regex
+        return pattern
+
+    def _patterns(self, start, count):
+        return tuple(
+            self._pattern(self._record(ATTACHMENT, 'attachments', index)[0])
+            for index in range(start, start + count))
+
+    def _compile_glob(self, pattern):
+        regex = self._regexes.get(pattern)
+        if regex is None:
+            # formatted placeholders, or not a pattern of this file
+            return super()._compile_glob(pattern)
+        if isinstance(regex, int):
+            regex = re.compile(self._string(regex))
+            self._regexes[pattern] = regex
+        return regex
+
+    def _rule(self, index):
+        profile, kind, qualifier, mask, attachment_start, attachment_count = \
+            self._record(RULE, 'rules', index)
+        return (
+            profile,
+            self._string(kind),
+            self._string(qualifier),
+            frozenset(
+                permission for bit, permission in enumerate(self._permissions)
+                if mask & (1 << bit)),
+            self._patterns(attachment_start, attachment_count),
+        )
+
+    def _applicable_rules(self, applicable):
+        for profile in sorted(applicable):
+            _, _, _, rule_start, rule_count = self._record(PROFILE, 'profiles', profile)
+            for index in range(rule_start, rule_start + rule_count):
+                yield self._rule(index)
+
+
+def _load_policy(path, cache_size, expected_stamp=None):
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        stamp = _file_stamp(stat)
+        if expected_stamp is not None and stamp != tuple(expected_stamp):
+            raise ValueError('Policy file %s changed since it was loaded' % path)
+        if stat.st_size == 0:
+            raise ValueError('Not a comarmor policy file')
+        # the mapping stays valid after the file is closed
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return MappedPolicy(
+        buffer, cache_size=cache_size, path=os.path.abspath(path), stamp=stamp)
+
+
+def load_policy(path, cache_size=DEFAULT_CACHE_SIZE):
+    """
+    Map a policy file written by :func:`write_policy`.
+
+    The policy can be pickled, e.g. to hand it to worker processes, which
+    map the same file and refuse to load it if it was replaced meanwhile.
+
+    :param path: policy file
+    :param cache_size: number of subjects whose tables are kept
+    :returns: :class:`MappedPolicy`
+    :raises: :exc:`ValueError` if the file is not a supported policy file
+    """
+    return _load_policy(path, cache_size)
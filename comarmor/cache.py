@@ -0,0 +1,137 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from xml.etree import cElementTree as ElementTree
+
+# bump whenever the layout of cache entries or the parse pipeline changes
+CACHE_FORMAT_VERSION = 1
+
+
+def file_digest(path):
+    """Return the sha256 hex digest of the file content at path."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ProfileCache:
+    """
+    On-disk cache of expanded and validated profile trees.
+
+    Entries are addressed by the content hash of the profile file, and
+    record the content hash of every file pulled in through XInclude.
+    An entry is only used if the whole include closure is unchanged.
+    """
+
+    __slots__ = [
+        'path',
+        '_digests',
+        '_salt',
+    ]
+
+    def __init__(self, path):
+        self.path = path
+        self._digests = {}
+        self._salt = None
+
+    def _digest(self, path):
+        # memoize digests, tunables are shared by most profiles; the inode
+        # tells apart files replaced keeping their size and mtime (cp -p)
+        stat = os.stat(path)
+        stamp = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        digest = self._digests.get(stamp)
+        if digest is None:
+            digest = file_digest(path)
+            self._digests[stamp] = digest
+        return digest
+
+    def discard(self, paths):
+        """Forget the memoized digests of files known to have changed."""
+        paths = {os.path.abspath(path) for path in paths}
+        for stamp in [stamp for stamp in self._digests if stamp[0] in paths]:
+            del self._digests[stamp]
+
+    def _key(self, path):
+        if self._salt is None:
+            from .schemas import get_profile_schema_path
+            self._salt = '%d:%s' % (
+                CACHE_FORMAT_VERSION,
+                file_digest(get_profile_schema_path('comarmor_profile.xsd')))
+        key = hashlib.sha256()
+        key.update(self._salt.encode('utf-8'))
+        key.update(os.path.abspath(path).encode('utf-8'))
+        key.update(self._digest(path).encode('utf-8'))
+        return key.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], key + '.json')
+
+    def get(self, path, dependencies=None):
+        """
+        Look up the cached profile tree for a profile file.
+
+        :param path: path of the comarmor profile file
+        :param dependencies: optional set, updated with the paths of all
+        files included by the profile if there is a valid entry
+        :returns: :class:`ElementTree` or ``None`` if there is no valid entry
+        """
+        try:
+            with open(self._entry_path(self._key(path)), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            for dependency, digest in entry['dependencies']:
+                if self._digest(dependency) != digest:
+                    return None
+            tree = ElementTree.ElementTree(ElementTree.fromstring(entry['profile']))
+            if dependencies is not None:
+                dependencies.update(dependency for dependency, _ in entry['dependencies'])
+            return tree
+        except (OSError, ValueError, KeyError, TypeError, ElementTree.ParseError):
+            return None
+
+    def store(self, path, tree, dependencies):
+        """
+        Store the expanded and validated profile tree for a profile file.
+
+        :param path: path of the comarmor profile file
+        :param tree: expanded and validated :class:`ElementTree`
+        :param dependencies: paths of all files included by the profile
+        """
+        entry = {
+            'dependencies': [
+                [os.path.abspath(dependency), self._digest(dependency)]
+                for dependency in sorted(dependencies)],
+            'profile': ElementTree.tostring(tree.getroot(), encoding='unicode'),
+        }
+        entry_path = self._entry_path(self._key(path))
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        # write atomically so concurrent jobs never read a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(temp_path, entry_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        shutil.rmtree(self.path, ignore_errors=True)
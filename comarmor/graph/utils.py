@@ -12,8 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import fnmatch
-import re
+import os
+
+from comarmor import stats
+from comarmor.matcher import compile_glob
+from comarmor.policy import compile_policy
 
 # from xml.etree import cElementTree as ElementTree
 # import networkx as nx
@@ -63,30 +66,65 @@ def get_all_subjects_from_profile(profile):
     return set(subjects)
 
 
-def add_edges_from_profile(profile, G):
+def _iter_profile_records(profile):
+    subject_names = None
     for element in list(profile):
         if element.tag == 'profile':
-            add_edges_from_profile(element, G)
+            yield from _iter_profile_records(element)
         elif element.tag in ['attachment']:
             pass
         else:
-            for subject_element in profile.findall('attachments/attachment'):
-                subject_name = subject_element.text
-                for object_element in element.findall('attachments/attachment'):
-                    object_name = object_element.text
-                    G.add_node(subject_name, type='subject', kind='subject',
-                               color=colors[profile.tag], style='filled', fontcolor='white')
-                    G.add_node(object_name, type='object', kind=element.tag,
-                               color=colors[element.tag], style='filled', fontcolor='white')
-                    for permission in list(element.find('permissions')):
-                        u, v = directions[permission.tag](subject_name, object_name)
-                        G.add_edge(u, v, label=permission.tag, color=colors[permission.tag])
+            if subject_names is None:
+                subject_names = [e.text for e in profile.findall('attachments/attachment')]
+            object_names = [e.text for e in element.findall('attachments/attachment')]
+            if not subject_names or not object_names:
+                continue
+            permissions = [permission.tag for permission in element.find('permissions')]
+            for subject_name in subject_names:
+                for object_name in object_names:
+                    yield profile.tag, subject_name, element.tag, object_name, permissions
+
+
+def iter_edges_from_profile(profile):
+    """Generate the ``(u, v, attrs)`` permission edges of a profile."""
+    for _, subject_name, _, object_name, permissions in _iter_profile_records(profile):
+        for permission in permissions:
+            u, v = directions[permission](subject_name, object_name)
+            yield u, v, {'label': permission, 'color': colors[permission]}
+
+
+def get_graph_records(profile):
+    """
+    Collect the nodes and edges of a profile graph in one pass.
+
+    :returns: tuple of a list of ``(node, attrs)`` and a list of
+    ``(u, v, attrs)``, ready for ``add_nodes_from`` and ``add_edges_from``
+    """
+    nodes = {}
+    edges = []
+    for profile_tag, subject_name, object_tag, object_name, permissions in \
+            _iter_profile_records(profile):
+        nodes[subject_name] = {
+            'type': 'subject', 'kind': 'subject',
+            'color': colors[profile_tag], 'style': 'filled', 'fontcolor': 'white'}
+        nodes[object_name] = {
+            'type': 'object', 'kind': object_tag,
+            'color': colors[object_tag], 'style': 'filled', 'fontcolor': 'white'}
+        for permission in permissions:
+            u, v = directions[permission](subject_name, object_name)
+            edges.append((u, v, {'label': permission, 'color': colors[permission]}))
+    return list(nodes.items()), edges
+
+
+def add_edges_from_profile(profile, G):
+    nodes, edges = get_graph_records(profile)
+    G.add_nodes_from(nodes)
+    G.add_edges_from(edges)
 
 
 def check_rule(rule, object_name, permission):
     for attachment in rule.findall('attachments/attachment'):
-        patern = re.compile(fnmatch.translate(attachment.text))
-        if patern.match(object_name):
+        if compile_glob(attachment.text).match(object_name):
             match = rule.find('permissions/' + permission)
             if match is not None:
                 return rule
@@ -104,38 +142,274 @@ def check_rules(rules, object_name, permission):
 
 
 def get_permissions(G, subject_name, object_name):
+    """
+    Collect the edges between a subject and an object, in both directions.
+
+    :returns: list of ``(u, v, edge data)`` tuples, including every
+    parallel edge of a multigraph
+    """
     permissions = []
-    permissionA = G.get_edge_data(subject_name, object_name)
-    permissionB = G.get_edge_data(object_name, subject_name)
-    for permission in [permissionA, permissionB]:
-        if permission:
-            permissions.append(permission)
+    for u, v in [(subject_name, object_name), (object_name, subject_name)]:
+        data = G.get_edge_data(u, v)
+        if not data:
+            continue
+        if G.is_multigraph():
+            permissions.extend((u, v, edge_data) for edge_data in data.values())
+        else:
+            permissions.append((u, v, data))
     return permissions
 
 
-def check_edges_from_profile(profile, G):
-    subjects = [(n, v) for n, v in G.nodes(data=True) if v['type'] == 'subject']
-    for subject_name, subject_values in subjects:
-        subject_profile = profile.filter_profile(subject_name).findall('./profile')
-        object_names = G.to_undirected().neighbors(subject_name)
-        for object_name in object_names:
-            object_values = G.node[object_name]
-            permissions = get_permissions(G, subject_name, object_name)
-            for permission in permissions:
-                permission_name = permission[0]['label']
-                deny_rules = subject_profile.findall(
-                    './/' + object_values['kind'] + '[@qualifier="DENY"]')
-                deny_matchs = check_rules(deny_rules, object_name, permission_name)
-                allow_rules = subject_profile.findall(
-                    './/' + object_values['kind'] + '[@qualifier="ALLOW"]')
-                allow_matchs = check_rules(allow_rules, object_name, permission_name)
-
-                if deny_matchs:
-                    qualifer = 'deny'
-                elif allow_matchs:
-                    qualifer = 'allow'
-                else:
-                    qualifer = 'deny'
-
-                permission[0]['qualifer'] = qualifer
-                permission[0]['color'] = colors[qualifer]
+def get_permission_checks(G):
+    """
+    List the permission checks needed to qualify the edges of a graph.
+
+    Every edge is checked once, for the subject :func:`get_edge_subject`
+    assigns it, as :class:`IncrementalChecker` does.
+
+    :returns: list of ``(subject, kind, object, permission, edge data)``
+    tuples in the order :func:`check_edges_from_profile` applies them
+    """
+    checks = []
+    subjects = [n for n, v in G.nodes(data=True) if v.get('type') == 'subject']
+    undirected = G.to_undirected(as_view=True)
+    for subject_name in subjects:
+        for object_name in undirected.neighbors(subject_name):
+            for u, v, data in get_permissions(G, subject_name, object_name):
+                permission_name = data.get('label')
+                if get_edge_subject(G, u, v, permission_name) != (subject_name, object_name):
+                    continue
+                checks.append((subject_name, G.nodes[object_name].get('kind'), object_name,
+                               permission_name, data))
+    return checks
+
+
+# policy of the current worker process, see _init_worker
+_worker_policy = None
+
+
+def _init_worker(policy):
+    global _worker_policy
+    _worker_policy = policy
+
+
+def _check_in_worker(checks):
+    return _worker_policy.check_batch(*zip(*checks))
+
+
+def check_edges_from_profile(profile, G, jobs=None):
+    """
+    Qualify the permission edges of a graph against profiles.
+
+    :param profile: :class:`ProfileStorage` to check against
+    :param G: graph built with :func:`add_edges_from_profile`
+    :param jobs: number of worker processes subjects are split across,
+    ``None`` to check in the calling process, ``0`` for one per CPU
+    """
+    with stats.stage('check.compile'):
+        policy = compile_policy(profile)
+    with stats.stage('check.collect'):
+        checks = get_permission_checks(G)
+    stats.count('check.edges', len(checks))
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    if jobs is None or jobs < 2 or not checks:
+        with stats.stage('check.qualify'):
+            qualifers = [policy.check(*check[:4]) for check in checks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        # split on subject boundaries, so each worker sees all edges of its subjects
+        chunks = []
+        chunk_size = max(1, len(checks) // (jobs * 4))
+        for check in checks:
+            if not chunks or (len(chunks[-1]) >= chunk_size and chunks[-1][-1][0] != check[0]):
+                chunks.append([])
+            chunks[-1].append(check[:4])
+        qualifers = []
+        with stats.stage('check.qualify'), ProcessPoolExecutor(
+                max_workers=min(jobs, len(chunks)),
+                initializer=_init_worker, initargs=(policy,)) as executor:
+            # map yields in submission order, so results merge back deterministically
+            for results in executor.map(_check_in_worker, chunks):
+                qualifers.extend(results)
+
+    for check, qualifer in zip(checks, qualifers):
+        qualifer = qualifer.lower()
+        check[4]['qualifer'] = qualifer
+        check[4]['color'] = colors[qualifer]
+
+
+def get_edge_subject(G, u, v, permission_name):
+    """Return the (subject, object) pair of a permission edge, or None."""
+    if permission_name not in directions:
+        return None
+    subject_name, object_name = directions[permission_name](u, v)
+    if G.nodes[subject_name].get('type') != 'subject':
+        subject_name, object_name = object_name, subject_name
+        if G.nodes[subject_name].get('type') != 'subject':
+            return None
+    return subject_name, object_name
+
+
+class IncrementalChecker:
+    """
+    Keep the qualification of permission edges of a directed graph up to date.
+
+    The checker remembers which subject, object kind and permission every
+    edge was qualified for.  Graph changes made through its methods, or
+    found by :meth:`sync`, only re-qualify the edges they affect.  A change
+    of the profile storage compiles a new policy, and only re-qualifies the
+    edges of subjects whose applicable rules changed.
+    """
+
+    def __init__(self, profile, G):
+        self.profile = profile
+        self.G = G
+        self.policy = None
+        self._revision = None
+        self._edges = {}
+        self.sync()
+
+    def _edge_keys(self, u, v):
+        if self.G.is_multigraph():
+            return [(u, v, key) for key in self.G[u][v]]
+        return [(u, v, None)]
+
+    def _edge_data(self, edge):
+        u, v, key = edge
+        if key is None:
+            return self.G[u][v]
+        return self.G[u][v][key]
+
+    def _signature(self, edge, data):
+        u, v, _ = edge
+        permission_name = data.get('label')
+        pair = get_edge_subject(self.G, u, v, permission_name)
+        if pair is None:
+            return None
+        subject_name, object_name = pair
+        return (subject_name, self.G.nodes[object_name].get('kind'), object_name,
+                permission_name)
+
+    def _qualify(self, edge, force=False):
+        data = self._edge_data(edge)
+        signature = self._signature(edge, data)
+        known = self._edges.get(edge)
+        if force or known is None or known[0] != signature:
+            qualifer = None if signature is None else self.policy.check(*signature).lower()
+            self._edges[edge] = (signature, qualifer)
+        else:
+            qualifer = known[1]
+        changed = known is None or known[1] != qualifer
+        # edge attributes may have been overwritten, e.g. by re-adding the edge
+        if qualifer is not None and (
+                data.get('qualifer') != qualifer or data.get('color') != colors[qualifer]):
+            data['qualifer'] = qualifer
+            data['color'] = colors[qualifer]
+            changed = True
+        return changed
+
+    def _check_profile(self):
+        """
+        Compile the profile storage if it changed.
+
+        :returns: the previous policy if a new one was compiled, else None
+        """
+        revision = getattr(self.profile, 'revision', None)
+        if self.policy is not None and revision is not None and revision == self._revision:
+            return None
+        previous = self.policy
+        self.policy = compile_policy(self.profile)
+        self._revision = revision
+        return previous
+
+    @staticmethod
+    def _subject_rules(policy, subject):
+        # decisions for a subject only depend on the rules applicable to it
+        applicable = set(policy.applicable_profiles(subject))
+        return frozenset(rule[1:] for rule in policy._applicable_rules(applicable))
+
+    def _is_affected(self, previous, subject, affected):
+        result = affected.get(subject)
+        if result is None:
+            result = self._subject_rules(previous, subject) != \
+                self._subject_rules(self.policy, subject)
+            affected[subject] = result
+        return result
+
+    def set_profile(self, profile):
+        """Replace the profile storage and re-qualify the edges it affects."""
+        self.profile = profile
+        # compile on the next sync, even if the revisions happen to match
+        self._revision = None
+        return self.sync()
+
+    def sync(self):
+        """
+        Bring the qualification in line with the graph and profile storage.
+
+        :returns: list of edges whose qualifier was changed
+        """
+        previous = self._check_profile()
+        affected = {}
+        if self.G.is_multigraph():
+            edges = self.G.edges(keys=True)
+        else:
+            edges = ((u, v, None) for u, v in self.G.edges())
+        changed = []
+        current = set()
+        for edge in edges:
+            current.add(edge)
+            force = False
+            if previous is not None:
+                known = self._edges.get(edge)
+                force = known is not None and known[0] is not None and \
+                    self._is_affected(previous, known[0][0], affected)
+            if self._qualify(edge, force=force):
+                changed.append(edge)
+        for edge in set(self._edges).difference(current):
+            del self._edges[edge]
+        return changed
+
+    def add_edge(self, u, v, key=None, **attr):
+        """Add an edge to the graph and qualify it."""
+        for node in (u, v):
+            if node not in self.G:
+                self.G.add_node(node)
+        if self.G.is_multigraph():
+            key = self.G.add_edge(u, v, key=key, **attr)
+        else:
+            self.G.add_edge(u, v, **attr)
+        self._qualify((u, v, key))
+        return key
+
+    def remove_edge(self, u, v, key=None):
+        """Remove an edge from the graph."""
+        if self.G.is_multigraph():
+            if key is None:
+                # same edge networkx removes when no key is given
+                key = list(self.G[u][v])[-1]
+            self.G.remove_edge(u, v, key=key)
+        else:
+            self.G.remove_edge(u, v)
+        self._edges.pop((u, v, key), None)
+
+    def _incident_edges(self, node):
+        edges = set()
+        for v in self.G.successors(node):
+            edges.update(self._edge_keys(node, v))
+        for u in self.G.predecessors(node):
+            edges.update(self._edge_keys(u, node))
+        return edges
+
+    def add_node(self, node, **attr):
+        """Add or update a node and re-qualify its edges."""
+        self.G.add_node(node, **attr)
+        return [edge for edge in self._incident_edges(node) if self._qualify(edge)]
+
+    def remove_node(self, node):
+        """Remove a node and its edges from the graph."""
+        for edge in self._incident_edges(node):
+            self._edges.pop(edge, None)
+        self.G.remove_node(node)
@@ -0,0 +1,173 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+
+from . import _ProfileParser, find_profile_paths
+from .profile import ProfileStorage
+
+
+def file_stamp(path):
+    """Return a value that changes whenever the file at path changes, or None."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class ProfileLoader:
+    """
+    Long-lived loader keeping a :class:`ProfileStorage` in sync with files.
+
+    Every profile records the files it includes, directly or through other
+    included files. :meth:`poll` compares the modification stamps of the
+    profile files and of their includes with those seen at the last poll,
+    and re-parses and re-validates only the changed profiles and the
+    profiles that include a changed file. Profiles added to or removed
+    from the watched directories are picked up as well. Included
+    fragments of unchanged files are reused between polls.
+
+    Profiles failing to load are listed in ``errors``, mapping their path
+    to the exception, and are only retried once they or their includes
+    change.
+    """
+
+    __slots__ = [
+        'paths',
+        'storage',
+        'errors',
+        '_parser',
+        '_profiles',
+        '_dependencies',
+        '_stamps',
+    ]
+
+    def __init__(self, paths, cache=None, fast_validation=True):
+        """
+        Create a loader, profiles are only loaded by the first :meth:`poll`.
+
+        :param paths: paths of comarmor profile files or directories
+        :param cache: optional :class:`comarmor.cache.ProfileCache`
+        :param fast_validation: see :func:`comarmor.parse_profiles`
+        """
+        self.paths = list(paths)
+        self.storage = ProfileStorage()
+        self.errors = {}
+        self._parser = _ProfileParser(cache=cache, fast_validation=fast_validation)
+        # absolute profile path -> Profile
+        self._profiles = {}
+        # absolute profile path -> absolute paths of all included files
+        self._dependencies = {}
+        # absolute path of every watched file -> stamp at the last poll
+        self._stamps = {}
+
+    def dependents(self, path):
+        """Return the profile paths including the file at path."""
+        path = os.path.abspath(path)
+        return [
+            profile_path for profile_path, dependencies in self._dependencies.items()
+            if path == profile_path or path in dependencies]
+
+    def _load(self, path):
+        dependencies = set()
+        try:
+            return self._parser(path, dependencies)
+        finally:
+            # watch whatever was reached, so a fixed include is picked up
+            self._dependencies[path] = {
+                os.path.abspath(dependency) for dependency in dependencies}
+
+    def _poll(self):
+        paths = [os.path.abspath(path) for path in find_profile_paths(self.paths)]
+        known = set(paths)
+        current = {path: file_stamp(path) for path in self._stamps}
+        changed = {path for path, stamp in self._stamps.items() if current[path] != stamp}
+        # a replaced file may keep the stamps the caches check
+        self._parser.include_cache.discard(changed)
+        if self._parser.cache is not None:
+            self._parser.cache.discard(changed)
+
+        reloaded = [path for path in self._profiles if path not in known]
+        reloaded.extend(path for path in self.errors if path not in known)
+        errors = []
+        for path in paths:
+            if (path in self._profiles or path in self.errors) and path not in changed and \
+                    self._dependencies[path].isdisjoint(changed):
+                continue
+            try:
+                self._profiles[path] = self._load(path)
+            except Exception as e:
+                self.errors[path] = e
+                errors.append((path, e))
+            else:
+                self.errors.pop(path, None)
+            reloaded.append(path)
+
+        for path in reloaded:
+            if path not in known:
+                self._profiles.pop(path, None)
+                self._dependencies.pop(path, None)
+                self.errors.pop(path, None)
+        stamps = {}
+        for path in paths:
+            for watched in {path} | self._dependencies.get(path, set()):
+                # stamps taken before parsing, so changes made meanwhile are seen next time
+                stamps[watched] = current[watched] if watched in current \
+                    else file_stamp(watched)
+        self._stamps = stamps
+
+        if reloaded:
+            self.storage[:] = [
+                self._profiles[path] for path in paths if path in self._profiles]
+        return reloaded, errors
+
+    def poll(self):
+        """
+        Reload the profiles affected by file changes since the last poll.
+
+        A profile failing to load keeps its previous version in the
+        storage, the other affected profiles are reloaded nonetheless.
+
+        :returns: list of the reloaded, added and removed profile paths
+        :raises: :exc:`InvalidProfile` for the first profile failing to load
+        :raises: :exc:`IOError`
+        """
+        reloaded, errors = self._poll()
+        if errors:
+            raise errors[0][1]
+        return reloaded
+
+    def watch(self, interval=1.0, on_error=None):
+        """
+        Poll for changes forever.
+
+        Profiles failing to load do not end the watch, they are reported
+        and kept in ``errors`` until they load again.
+
+        :param interval: seconds to wait between polls
+        :param on_error: optional callable invoked with ``(path, exception)``
+        for every profile failing to load
+        :returns: generator yielding the paths of every poll which changed
+        the storage, as :meth:`poll` returns them
+        """
+        while True:
+            reloaded, errors = self._poll()
+            if on_error is not None:
+                for path, error in errors:
+                    on_error(path, error)
+            if reloaded:
+                yield reloaded
+            time.sleep(interval)
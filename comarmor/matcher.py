@@ -0,0 +1,114 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fnmatch
+import functools
+import re
+
+GLOB_CHARS = '*?['
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_glob(pattern):
+    """Compile an attachment expression, caching the result."""
+    return re.compile(fnmatch.translate(pattern))
+
+
+def glob_prefix(pattern):
+    """Return the literal part of an attachment expression before any wildcard."""
+    for index, char in enumerate(pattern):
+        if char in GLOB_CHARS:
+            return pattern[:index]
+    return pattern
+
+
+class AttachmentMatcher:
+    """
+    Match names against a set of attachment expressions in a single scan.
+
+    Expressions without wildcards are looked up in a dict.  The others are
+    stored in a character trie keyed by their literal prefix, so only the
+    expressions whose prefix is a prefix of the name are tested, and the
+    cost of a lookup grows with the length of the name rather than with
+    the number of expressions.
+    """
+
+    __slots__ = [
+        '_compiler',
+        '_literals',
+        '_trie',
+        '_size',
+    ]
+
+    def __init__(self, items=(), compiler=compile_glob):
+        """
+        Create a matcher.
+
+        :param items: ``(pattern, value)`` pairs to add
+        :param compiler: callable returning the compiled regex of a pattern
+        """
+        self._compiler = compiler
+        self._literals = {}
+        # trie nodes are [children, entries], entries are (index, regex, value)
+        self._trie = [{}, []]
+        self._size = 0
+        for pattern, value in items:
+            self.add(pattern, value)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, pattern, value=None):
+        """Add an attachment expression, reported as value when it matches."""
+        index = self._size
+        self._size += 1
+        prefix = glob_prefix(pattern)
+        if prefix == pattern:
+            self._literals.setdefault(pattern, []).append((index, value))
+            return
+        node = self._trie
+        for char in prefix:
+            node = node[0].setdefault(char, [{}, []])
+        node[1].append((index, self._compiler(pattern), value))
+
+    def _candidates(self, name):
+        node = self._trie
+        candidates = [node[1]] if node[1] else []
+        for char in name:
+            node = node[0].get(char)
+            if node is None:
+                break
+            if node[1]:
+                candidates.append(node[1])
+        return candidates
+
+    def match_all(self, name):
+        """Return the values of all expressions matching name, in insertion order."""
+        matches = list(self._literals.get(name, ()))
+        for entries in self._candidates(name):
+            for index, regex, value in entries:
+                if regex.match(name):
+                    matches.append((index, value))
+        matches.sort(key=lambda match: match[0])
+        return [value for _, value in matches]
+
+    def matches(self, name):
+        """Return whether any expression matches name."""
+        if name in self._literals:
+            return True
+        for entries in self._candidates(name):
+            for _, regex, _ in entries:
+                if regex.match(name):
+                    return True
+        return False
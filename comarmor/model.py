@@ -0,0 +1,277 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compact object model of comarmor profiles.
+
+Profiles are held as :class:`ProfileNode` and :class:`Rule` objects
+instead of element trees: attachment expressions and names are interned
+strings, permissions are integer bitmasks and neither whitespace nor the
+``attachments`` and ``permissions`` wrapper elements are kept.
+"""
+
+import sys
+from xml.etree import cElementTree as ElementTree
+
+# permission tags in schema order, a permission is stored as 1 << index
+PERMISSIONS = (
+    'publish',
+    'relay',
+    'subscribe',
+    'ros_publish',
+    'ros_relay',
+    'ros_subscribe',
+    'ros_call',
+    'ros_execute',
+)
+
+PERMISSION_BITS = {permission: 1 << index for index, permission in enumerate(PERMISSIONS)}
+
+
+def permission_mask(tags):
+    """Return the bitmask of permission tags."""
+    mask = 0
+    for tag in tags:
+        try:
+            mask |= PERMISSION_BITS[tag]
+        except KeyError:
+            raise ValueError("Unknown permission '%s'" % tag)
+    return mask
+
+
+def permission_tags(mask):
+    """Return the permission tags of a bitmask, in schema order."""
+    return [permission for permission in PERMISSIONS if mask & PERMISSION_BITS[permission]]
+
+
+def _intern(text):
+    return sys.intern(text) if text is not None else None
+
+
+def _attachments(element):
+    return tuple(
+        _intern(attachment.text) for attachment in element.findall('attachments/attachment'))
+
+
+def _append_attachments(element, attachments):
+    attachments_element = ElementTree.SubElement(element, 'attachments')
+    for attachment in attachments:
+        ElementTree.SubElement(attachments_element, 'attachment').text = attachment
+
+
+class Rule:
+    """Rule of a profile, e.g. a ``topic`` element."""
+
+    __slots__ = [
+        'kind',
+        'qualifier',
+        'modifier',
+        'attachments',
+        'permissions',
+    ]
+
+    def __init__(self, kind, qualifier, attachments=(), permissions=0, modifier=None):
+        self.kind = sys.intern(kind)
+        self.qualifier = sys.intern(qualifier)
+        self.modifier = _intern(modifier)
+        self.attachments = tuple(_intern(attachment) for attachment in attachments)
+        self.permissions = permissions
+
+    def __eq__(self, other):
+        if not isinstance(other, Rule):
+            return NotImplemented
+        return all(getattr(self, attr) == getattr(other, attr) for attr in self.__slots__)
+
+    def __str__(self):
+        data = {}
+        for attr in self.__slots__:
+            data[attr] = getattr(self, attr)
+        data['permissions'] = permission_tags(self.permissions)
+        return str(data)
+
+    def permission_tags(self):
+        return permission_tags(self.permissions)
+
+    @classmethod
+    def from_element(cls, element):
+        permissions = element.find('permissions')
+        return cls(
+            element.tag, element.get('qualifier'),
+            attachments=_attachments(element),
+            permissions=permission_mask(
+                permission.tag for permission in permissions) if permissions is not None else 0,
+            modifier=element.get('modifier'))
+
+    def to_element(self):
+        element = ElementTree.Element(self.kind)
+        element.set('qualifier', self.qualifier)
+        if self.modifier is not None:
+            element.set('modifier', self.modifier)
+        _append_attachments(element, self.attachments)
+        permissions = ElementTree.SubElement(element, 'permissions')
+        for permission in permission_tags(self.permissions):
+            ElementTree.SubElement(permissions, permission)
+        return element
+
+
+class ProfileNode:
+    """Profile element, holding its rules and nested profiles in document order."""
+
+    __slots__ = [
+        'name',
+        'modifier',
+        'attachments',
+        'children',
+    ]
+
+    def __init__(self, name, attachments=(), children=(), modifier=None):
+        self.name = _intern(name)
+        self.modifier = _intern(modifier)
+        self.attachments = tuple(_intern(attachment) for attachment in attachments)
+        self.children = tuple(children)
+
+    def __eq__(self, other):
+        if not isinstance(other, ProfileNode):
+            return NotImplemented
+        return all(getattr(self, attr) == getattr(other, attr) for attr in self.__slots__)
+
+    def __str__(self):
+        data = {}
+        for attr in self.__slots__:
+            data[attr] = getattr(self, attr)
+        data['children'] = [str(child) for child in self.children]
+        return str(data)
+
+    def iter_profiles(self):
+        """Generate this profile and all nested profiles in document order."""
+        yield self
+        for child in self.children:
+            if isinstance(child, ProfileNode):
+                yield from child.iter_profiles()
+
+    def iter_rules(self, kind=None):
+        """Generate the rules of this and all nested profiles in document order."""
+        for child in self.children:
+            if isinstance(child, ProfileNode):
+                yield from child.iter_rules(kind)
+            elif kind is None or child.kind == kind:
+                yield child
+
+    @classmethod
+    def from_element(cls, element):
+        children = []
+        for child in element:
+            if child.tag == 'profile':
+                children.append(cls.from_element(child))
+            elif child.tag != 'attachments':
+                children.append(Rule.from_element(child))
+        return cls(
+            element.get('name'), attachments=_attachments(element),
+            children=children, modifier=element.get('modifier'))
+
+    def to_element(self):
+        element = ElementTree.Element('profile')
+        element.set('name', self.name)
+        if self.modifier is not None:
+            element.set('modifier', self.modifier)
+        _append_attachments(element, self.attachments)
+        for child in self.children:
+            element.append(child.to_element())
+        return element
+
+
+class CompactProfile:
+    """Compact counterpart of :class:`comarmor.profile.Profile`."""
+
+    __slots__ = [
+        'path',
+        'profiles',
+    ]
+
+    def __init__(self, path=None, profiles=()):
+        self.path = path
+        self.profiles = tuple(profiles)
+
+    def __len__(self):
+        return self.profiles.__len__()
+
+    def __getitem__(self, index):
+        return self.profiles.__getitem__(index)
+
+    def __str__(self):
+        data = {}
+        for attr in self.__slots__:
+            data[attr] = getattr(self, attr)
+        return str(data)
+
+    def empty(self):
+        return not self.profiles
+
+    @classmethod
+    def from_profile(cls, profile):
+        """Convert a :class:`comarmor.profile.Profile`."""
+        root = profile.tree.getroot()
+        return cls(
+            path=profile.path,
+            profiles=[ProfileNode.from_element(element) for element in root.findall('profile')])
+
+    def to_tree(self):
+        """Return the ``profiles`` element tree, whitespace normalized as when parsed."""
+        from .xml import utils
+        root = ElementTree.Element('profiles')
+        for profile in self.profiles:
+            root.append(profile.to_element())
+        return ElementTree.ElementTree(utils.normalize_xml(root))
+
+    def to_profile(self):
+        """Convert back to a :class:`comarmor.profile.Profile`."""
+        from .profile import Profile
+        return Profile(path=self.path, tree=self.to_tree())
+
+    def iter_profiles(self):
+        """Generate all profiles and nested profiles in document order."""
+        for profile in self.profiles:
+            yield from profile.iter_profiles()
+
+    def extract_rules(self, kind):
+        """Return the rules of a kind, as :meth:`Profile.extract_rules` does."""
+        rules = []
+        for profile in self.profiles:
+            rules.extend(profile.iter_rules(kind))
+        return rules
+
+    def findall(self, path, namespaces=None):
+        """
+        Evaluate an element path, as :meth:`Profile.findall` does.
+
+        This is a slow compatibility path: every call builds and normalizes
+        the whole element tree, only to discard it afterwards. Use
+        :meth:`extract_rules` or :meth:`iter_profiles` to walk the rules and
+        profiles without building elements.
+        """
+        root = self.to_tree().getroot()
+        results = ElementTree.Element('results')
+        results.extend(root.findall(path, namespaces))
+        return results
+
+
+def compact_storage(storage):
+    """Convert a :class:`comarmor.profile.ProfileStorage` to a list of :class:`CompactProfile`."""
+    return [CompactProfile.from_profile(profile) for profile in storage]
+
+
+def expand_storage(profiles):
+    """Convert :class:`CompactProfile` objects back to a :class:`ProfileStorage`."""
+    from .profile import ProfileStorage
+    return ProfileStorage(profiles=[profile.to_profile() for profile in profiles])
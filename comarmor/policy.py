@@ -0,0 +1,230 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+
+from . import stats
+from .matcher import AttachmentMatcher, compile_glob
+from .profile import namespace_split
+
+ALLOW = 'ALLOW'
+DENY = 'DENY'
+
+DEFAULT_CACHE_SIZE = 1024
+
+
+def compile_attachments(patterns, compiler=compile_glob):
+    """Compile attachment expressions into a matcher, or None if empty."""
+    patterns = OrderedDict.fromkeys(patterns)
+    if not patterns:
+        return None
+    return AttachmentMatcher(((pattern, None) for pattern in patterns), compiler=compiler)
+
+
+def _collect(element, parent, profiles, rules):
+    index = len(profiles)
+    profiles.append((parent, tuple(
+        attachment.text or '' for attachment in element.findall('attachments/attachment'))))
+    for child in element:
+        if child.tag == 'profile':
+            _collect(child, index, profiles, rules)
+        elif child.tag != 'attachments' and child.get('qualifier') is not None:
+            permissions = child.find('permissions')
+            rules.append((
+                index,
+                child.tag,
+                child.get('qualifier'),
+                frozenset(permission.tag for permission in permissions)
+                if permissions is not None else frozenset(),
+                tuple(attachment.text or ''
+                      for attachment in child.findall('attachments/attachment')),
+            ))
+
+
+class Policy:
+    """
+    Decision tables compiled from comarmor profiles.
+
+    Profiles are flattened in document order into ``profiles``, tuples of
+    the parent profile index (-1 for top level profiles) and attachment
+    expressions, and ``rules``, tuples of the enclosing profile index,
+    object kind, qualifier, permission tags and attachment expressions.
+    Per subject tables are derived from these on first use and kept in a
+    bounded cache.
+    """
+
+    __slots__ = [
+        'profiles',
+        'rules',
+        'cache_size',
+        '_profile_matcher',
+        '_subjects',
+    ]
+
+    def __init__(self, profiles, rules, cache_size=DEFAULT_CACHE_SIZE):
+        self.profiles = tuple(profiles)
+        self.rules = tuple(rules)
+        self.cache_size = cache_size
+        self._profile_matcher = self._match_profiles()
+        self._subjects = OrderedDict()
+
+    def _compile_glob(self, pattern):
+        return compile_glob(pattern)
+
+    def _match_profiles(self):
+        return AttachmentMatcher((
+            (pattern, index)
+            for index, (_, patterns) in enumerate(self.profiles)
+            for pattern in patterns), compiler=self._compile_glob)
+
+    def _applicable_rules(self, applicable):
+        """Generate the rules of the given profile indices."""
+        for rule in self.rules:
+            if rule[0] in applicable:
+                yield rule
+
+    def applicable_profiles(self, subject):
+        """Return the indices of the profiles applicable to a subject."""
+        applicable = set()
+        # parents precede their children, so their applicability is known
+        for index in sorted(set(self._profile_matcher.match_all(subject))):
+            parent = self.profiles[index][0]
+            if parent < 0 or parent in applicable:
+                applicable.add(index)
+        return sorted(applicable)
+
+    def _compile_subject(self, subject):
+        namespace, name = namespace_split(subject)
+        format_args = {
+            'name': name,
+            'namespace': namespace,
+        }
+        applicable = set(self.applicable_profiles(subject))
+        globs = {}
+        for _, kind, qualifier, permissions, attachments in self._applicable_rules(applicable):
+            attachments = [attachment.format(**format_args) for attachment in attachments]
+            for permission in permissions:
+                globs.setdefault((kind, permission, qualifier), []).extend(attachments)
+        table = {}
+        for kind, permission, _ in globs:
+            if (kind, permission) not in table:
+                table[(kind, permission)] = (
+                    compile_attachments(
+                        globs.get((kind, permission, DENY), []), compiler=self._compile_glob),
+                    compile_attachments(
+                        globs.get((kind, permission, ALLOW), []), compiler=self._compile_glob))
+        return table
+
+    def subject_table(self, subject):
+        """
+        Return the decision table of a subject.
+
+        :returns: dict mapping ``(kind, permission)`` to a tuple of the
+        DENY and ALLOW :class:`AttachmentMatcher`, either of which may be ``None``
+        """
+        table = self._subjects.get(subject)
+        if table is None:
+            stats.count('check.subject_tables')
+            table = self._compile_subject(subject)
+            self._subjects[subject] = table
+            if len(self._subjects) > self.cache_size:
+                self._subjects.popitem(last=False)
+        else:
+            self._subjects.move_to_end(subject)
+        return table
+
+    def check(self, subject, kind, object_name, permission):
+        """
+        Decide whether a subject holds a permission on an object.
+
+        DENY rules take precedence over ALLOW rules, and anything not
+        explicitly allowed is denied.
+
+        :param subject: subject name, e.g. ``/talker``
+        :param kind: object kind, i.e. the rule tag such as ``topic``
+        :param object_name: object name, e.g. ``/chatter``
+        :param permission: permission tag, e.g. ``publish``
+        :returns: :data:`ALLOW` or :data:`DENY`
+        """
+        patterns = self.subject_table(subject).get((kind, permission))
+        if patterns is None:
+            return DENY
+        deny, allow = patterns
+        if deny is not None and deny.matches(object_name):
+            return DENY
+        if allow is not None and allow.matches(object_name):
+            return ALLOW
+        return DENY
+
+    def check_batch(self, subjects, kinds, object_names, permissions):
+        """
+        Decide a batch of access requests.
+
+        Requests are grouped by subject, then by object kind and
+        permission, so every compiled pattern is applied once to each
+        distinct object name of its group.
+
+        :param subjects: subject names
+        :param kinds: object kinds
+        :param object_names: object names
+        :param permissions: permission tags
+        :returns: list of :data:`ALLOW` or :data:`DENY`, one per request
+        """
+        subjects = list(subjects)
+        kinds = list(kinds)
+        object_names = list(object_names)
+        permissions = list(permissions)
+        size = len(subjects)
+        if not len(kinds) == len(object_names) == len(permissions) == size:
+            raise ValueError('Batch columns must have the same length')
+
+        groups = {}
+        for index in range(size):
+            subject_groups = groups.setdefault(subjects[index], {})
+            names = subject_groups.setdefault((kinds[index], permissions[index]), {})
+            names.setdefault(object_names[index], []).append(index)
+
+        decisions = [DENY] * size
+        for subject, subject_groups in groups.items():
+            table = self.subject_table(subject)
+            for key, names in subject_groups.items():
+                patterns = table.get(key)
+                if patterns is None:
+                    continue
+                deny, allow = patterns
+                if allow is None:
+                    continue
+                for object_name, indices in names.items():
+                    if deny is not None and deny.matches(object_name):
+                        continue
+                    if allow.matches(object_name):
+                        for index in indices:
+                            decisions[index] = ALLOW
+        return decisions
+
+
+def compile_policy(storage, cache_size=DEFAULT_CACHE_SIZE):
+    """
+    Compile profiles into a :class:`Policy`.
+
+    :param storage: :class:`ProfileStorage` to compile
+    :param cache_size: number of subjects whose tables are kept
+    :returns: compiled :class:`Policy`
+    """
+    profiles = []
+    rules = []
+    for profile in storage:
+        for element in profile.tree.getroot().findall('profile'):
+            _collect(element, -1, profiles, rules)
+    return Policy(profiles, rules, cache_size=cache_size)
@@ -12,12 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import OrderedDict
 from collections.abc import MutableSequence
 import copy
-import fnmatch
-import re
 from xml.etree import cElementTree as ElementTree
 
+from . import stats
+from .matcher import AttachmentMatcher, compile_glob
+
 
 def filter_rec(node, element, func):
     """Filter recursively all attachable comarmor profile."""
@@ -28,6 +30,43 @@ def filter_rec(node, element, func):
             filter_rec(item, element, func)
 
 
+def _format_attachments(element, format_args, nested=True):
+    """Return element, or a copy with its attachment placeholders formatted."""
+    if format_args is None:
+        return element
+
+    def attachments(element):
+        found = element.findall('.//attachments/attachment')
+        if nested and element.tag == 'attachments':
+            found.extend(element.findall('attachment'))
+        return found
+
+    for attachment in attachments(element):
+        if attachment.text and ('{' in attachment.text or '}' in attachment.text):
+            break
+    else:
+        return element
+    element = copy.deepcopy(element)
+    for attachment in attachments(element):
+        if attachment.text:
+            attachment.text = attachment.text.format(**format_args)
+    return element
+
+
+def filter_view_rec(node, func, format_args, nested=False):
+    """Rebuild node with the attachable profiles only, sharing all other elements."""
+    view = ElementTree.Element(node.tag, node.attrib)
+    view.text = node.text
+    view.tail = node.tail
+    for item in node:
+        if item.tag == 'profile':
+            if func(item):
+                view.append(filter_view_rec(item, func, format_args, nested=True))
+        else:
+            view.append(_format_attachments(item, format_args, nested=nested))
+    return view
+
+
 def namespace_split(fqn):
     namespace, name = fqn.rsplit('/', 1)
     return namespace + '/', name
@@ -68,30 +107,36 @@ class Profile:
     def empty(self):
         return self.tree.find('profile') is None
 
-    def filter_profile(self, key):
-        filtered_profile = copy.deepcopy(self)
-        root = filtered_profile.tree.getroot()
+    def filter_view(self, key):
+        """
+        Filter the profile for a subject without copying it.
 
+        Only the profile elements are rebuilt. Rules and attachments are
+        shared with this profile, unless they contain "{name}" or
+        "{namespace}" placeholders, which are formatted in a copy. Use
+        :meth:`filter_profile` or deep copy the view before modifying it.
+        """
         def filter_func(node):
             for attachment in node.findall('attachments/attachment'):
-                patern = re.compile(fnmatch.translate(attachment.text))
-                if patern.match(key):
+                if compile_glob(attachment.text).match(key):
                     return True
             else:
                 return False
 
-        filter_rec(node=root, element='profile', func=filter_func)
-
         # Format all "{name},{namespace}" occurrences in object attachments
         namespace, name = namespace_split(key)
         format_args = {
             'name': name,
             'namespace': namespace,
         }
-        for attachment in root.findall('.//*/attachments/attachment'):
-            attachment.text = attachment.text.format(**format_args)
+        with stats.stage('filter.view', self.path):
+            root = filter_view_rec(self.tree.getroot(), filter_func, format_args)
+        return Profile(path=self.path, tree=ElementTree.ElementTree(root))
 
-        return filtered_profile
+    def filter_profile(self, key):
+        view = self.filter_view(key)
+        with stats.stage('filter.copy', self.path):
+            return copy.deepcopy(view)
 
     def extract_rules(self, kind):
         root = self.tree.getroot()
@@ -111,17 +156,20 @@ class ProfileStorage(MutableSequence):
 
     __slots__ = [
         'profiles',
+        '_revision',
     ]
 
     def __init__(self, **kwargs):
+        self._revision = 0
 
-        # initialize all slots with values
-        for attr in self.__slots__:
+        # initialize all public slots with values
+        attrs = [attr for attr in self.__slots__ if not attr.startswith('_')]
+        for attr in attrs:
             value = kwargs[attr] if attr in kwargs else []
             setattr(self, attr, value)
 
         # verify that no unknown keywords are passed
-        unknown = set(kwargs.keys()).difference(self.__slots__)
+        unknown = set(kwargs.keys()).difference(attrs)
         if unknown:
             raise TypeError('Unknown properties: %s' % ', '.join(unknown))
 
@@ -135,27 +183,50 @@ class ProfileStorage(MutableSequence):
 
     def __delitem__(self, key):
         self.profiles.__delitem__(key)
+        self._revision += 1
 
     def __setitem__(self, key, value):
         self.profiles.__setitem__(key, value)
+        self._revision += 1
 
     def insert(self, key, value):
         self.profiles.insert(key, value)
+        self._revision += 1
 
     def __str__(self):
         data = {}
         for attr in self.__slots__:
-            data[attr] = getattr(self, attr)
+            if not attr.startswith('_'):
+                data[attr] = getattr(self, attr)
         return str(data)
 
-    def filter_profile(self, key):
-        profile_storage = copy.deepcopy(self)
-        for i in reversed(range(len(profile_storage))):
-            profile_storage[i] = profile_storage[i].filter_profile(key)
-            if profile_storage[i].empty():
-                del profile_storage[i]
+    @property
+    def revision(self):
+        """Counter incremented whenever profiles are added, removed or replaced."""
+        return self._revision
+
+    def mark_changed(self):
+        """Record that profile trees were modified in place."""
+        self._revision += 1
+
+    def filter_view(self, key):
+        """
+        Filter all profiles for a subject without copying them.
+
+        See :meth:`Profile.filter_view` for which elements are shared.
+        """
+        profile_storage = ProfileStorage()
+        for profile in self:
+            profile = profile.filter_view(key)
+            if not profile.empty():
+                profile_storage.append(profile)
         return profile_storage
 
+    def filter_profile(self, key):
+        view = self.filter_view(key)
+        with stats.stage('filter.copy'):
+            return copy.deepcopy(view)
+
     def extract_rules(self, kind):
         rules = ElementTree.Element('rules')
         for profile in self:
@@ -167,3 +238,113 @@ class ProfileStorage(MutableSequence):
         for profile in self:
             results.extend(profile.findall(path, namespaces))
         return results
+
+
+def _index_profiles(element, parent, profiles):
+    profiles.append((parent, element))
+    index = len(profiles) - 1
+    for item in element.findall('profile'):
+        _index_profiles(item, index, profiles)
+
+
+class SpecializationCache:
+    """
+    Memoized filtering of a :class:`ProfileStorage` for many subjects.
+
+    Subjects to which the same set of profiles applies share one pruned
+    template, so only the placeholder formatting is done per subject.
+    Templates are kept in a bounded LRU cache, dropped whenever the
+    revision of the storage changes.
+    """
+
+    __slots__ = [
+        'storage',
+        'maxsize',
+        '_revision',
+        '_profiles',
+        '_matcher',
+        '_templates',
+    ]
+
+    def __init__(self, storage, maxsize=128):
+        self.storage = storage
+        self.maxsize = maxsize
+        self._revision = None
+        self._profiles = None
+        self._matcher = None
+        self._templates = OrderedDict()
+
+    def clear(self):
+        self._revision = None
+        self._templates.clear()
+
+    def _update(self):
+        if self._revision == self.storage.revision:
+            return
+        profiles = []
+        for profile in self.storage:
+            for element in profile.tree.getroot().findall('profile'):
+                _index_profiles(element, -1, profiles)
+        self._profiles = profiles
+        self._matcher = AttachmentMatcher(
+            (attachment.text, index)
+            for index, (_, element) in enumerate(profiles)
+            for attachment in element.findall('attachments/attachment')
+            if attachment.text is not None)
+        self._templates.clear()
+        self._revision = self.storage.revision
+
+    def _applicable(self, key):
+        applicable = set()
+        # parents precede their children, so their applicability is known
+        for index in sorted(set(self._matcher.match_all(key))):
+            parent = self._profiles[index][0]
+            if parent < 0 or parent in applicable:
+                applicable.add(index)
+        return frozenset(applicable)
+
+    def _template(self, key):
+        self._update()
+        applicable = self._applicable(key)
+        template = self._templates.get(applicable)
+        if template is not None:
+            self._templates.move_to_end(applicable)
+            stats.count('filter.template_hits')
+            return template
+        stats.count('filter.template_misses')
+
+        elements = {id(self._profiles[index][1]) for index in applicable}
+
+        def filter_func(node):
+            return id(node) in elements
+
+        template = []
+        for profile in self.storage:
+            root = filter_view_rec(profile.tree.getroot(), filter_func, None)
+            if root.find('profile') is not None:
+                placeholders = any(
+                    attachment.text and ('{' in attachment.text or '}' in attachment.text)
+                    for attachment in root.iter('attachment'))
+                template.append((profile.path, root, placeholders))
+        self._templates[applicable] = template
+        if len(self._templates) > self.maxsize:
+            self._templates.popitem(last=False)
+        return template
+
+    def filter_view(self, key):
+        """Return the same result as :meth:`ProfileStorage.filter_view`."""
+        namespace, name = namespace_split(key)
+        format_args = {
+            'name': name,
+            'namespace': namespace,
+        }
+        profile_storage = ProfileStorage()
+        for path, root, placeholders in self._template(key):
+            if placeholders:
+                root = filter_view_rec(root, lambda node: True, format_args)
+            profile_storage.append(Profile(path=path, tree=ElementTree.ElementTree(root)))
+        return profile_storage
+
+    def filter_profile(self, key):
+        """Return the same result as :meth:`ProfileStorage.filter_profile`."""
+        return copy.deepcopy(self.filter_view(key))
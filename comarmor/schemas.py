@@ -12,12 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import os
 
-import pkg_resources
-
 
 def get_profile_schema_path(name):
-    return pkg_resources.resource_filename(
-        package_or_requirement='comarmor',
-        resource_name=os.path.join('schema', 'profile', name))
+    # the schemas are installed as package data next to this module
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema', 'profile', name)
+
+
+@functools.lru_cache(maxsize=None)
+def get_profile_schema(name='comarmor_profile.xsd'):
+    """Return the compiled profile schema, built once per process."""
+    import xmlschema
+    return xmlschema.XMLSchema(get_profile_schema_path(name))
@@ -0,0 +1,187 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Opt-in timing and counters of the processing stages.
+
+Instrumented code calls :func:`stage`, :func:`count` and :func:`maximum`,
+which do nothing unless a :class:`Stats` object is collecting::
+
+    stats = Stats()
+    with stats.collect():
+        storage = parse_profiles(paths)
+    print(stats.report())
+
+Stages are named ``<area>.<step>``, e.g. ``parse.validate``, and may be
+keyed, e.g. by file path, so the slowest files can be found with
+:meth:`Stats.slowest`. Only the calling process is measured, stages run
+in worker processes (``jobs``) are not recorded.
+"""
+
+from contextlib import contextmanager
+import time
+
+# Stats collecting in this process, see Stats.collect
+_active = None
+
+
+class _NullStage:
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = [
+        'stats',
+        'name',
+        'key',
+        'start',
+    ]
+
+    def __init__(self, stats, name, key):
+        self.stats = stats
+        self.name = name
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.add_time(self.name, time.perf_counter() - self.start, self.key)
+        return False
+
+
+def stage(name, key=None):
+    """
+    Time a stage of processing, when stats are collected.
+
+    :param name: stage name
+    :param key: optional key the time is also accounted to, e.g. a path
+    :returns: context manager
+    """
+    stats = _active
+    if stats is None:
+        return _NULL_STAGE
+    return _Stage(stats, name, key)
+
+
+def count(name, value=1):
+    """Add to a counter, when stats are collected."""
+    stats = _active
+    if stats is not None:
+        stats.add_count(name, value)
+
+
+def maximum(name, value):
+    """Raise a maximum to value, when stats are collected."""
+    stats = _active
+    if stats is not None:
+        stats.add_maximum(name, value)
+
+
+class Stats:
+    """
+    Time spent and counters per stage.
+
+    :param hook: optional callable invoked with ``(name, key, seconds)``
+    whenever a stage completes, e.g. to forward to a metrics system
+    """
+
+    __slots__ = [
+        'hook',
+        'times',
+        'counts',
+        'maxima',
+        'keys',
+    ]
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        # stage -> [seconds, calls]
+        self.times = {}
+        self.counts = {}
+        self.maxima = {}
+        # (stage, key) -> seconds
+        self.keys = {}
+
+    def clear(self):
+        self.times.clear()
+        self.counts.clear()
+        self.maxima.clear()
+        self.keys.clear()
+
+    def add_time(self, name, seconds, key=None):
+        entry = self.times.get(name)
+        if entry is None:
+            self.times[name] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+        if key is not None:
+            self.keys[(name, key)] = self.keys.get((name, key), 0.0) + seconds
+        if self.hook is not None:
+            self.hook(name, key, seconds)
+
+    def add_count(self, name, value=1):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def add_maximum(self, name, value):
+        if value > self.maxima.get(name, value - 1):
+            self.maxima[name] = value
+
+    @contextmanager
+    def collect(self):
+        """Collect the stats of this process within the context."""
+        global _active
+        previous = _active
+        _active = self
+        try:
+            yield self
+        finally:
+            _active = previous
+
+    def slowest(self, name, limit=10):
+        """Return the ``(key, seconds)`` pairs of a stage, slowest first."""
+        entries = [(key, seconds) for (stage, key), seconds in self.keys.items() if stage == name]
+        entries.sort(key=lambda entry: entry[1], reverse=True)
+        return entries[:limit]
+
+    def as_dict(self):
+        return {
+            'times': {name: {'seconds': seconds, 'calls': calls}
+                      for name, (seconds, calls) in self.times.items()},
+            'counts': dict(self.counts),
+            'maxima': dict(self.maxima),
+        }
+
+    def report(self):
+        """Return a human readable table of the collected stats."""
+        lines = ['%-32s %12s %8s' % ('stage', 'ms', 'calls')]
+        for name in sorted(self.times):
+            seconds, calls = self.times[name]
+            lines.append('%-32s %12.3f %8d' % (name, seconds * 1000, calls))
+        for name in sorted(self.counts):
+            lines.append('%-32s %12s %8d' % (name, '', self.counts[name]))
+        for name in sorted(self.maxima):
+            lines.append('%-32s %12s %8s' % (name, 'max', self.maxima[name]))
+        return '\n'.join(lines)
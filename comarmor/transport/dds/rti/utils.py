@@ -12,9 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import Counter
 from xml.etree import cElementTree as ElementTree
 
-from comarmor.xml.helpers import compress_profiles, sort_profiles
+from comarmor import stats
+from comarmor.xml.helpers import \
+    canonicalize_profiles, compress_profile, compress_profiles, sort_profiles
 
 
 def rchop(thestring, ending):
@@ -119,13 +122,19 @@ def set_rule(profile, object_type, object_name, permission_mode, qualifier):
     set_permissions(rule, permission_mode)
 
 
-def set_rules(profile, datas, dds_mode, qualifier):
+def get_rule_datas(datas, dds_mode):
+    """Generate the ``(object_type, object_name, permission_mode)`` of endpoint datas."""
     for data in datas:
         topic_name = data.findtext('topic_name')
         ros_mode = topic_name[0:2]
         object_type = object_mapping[ros_mode]
         object_name = object_naming[ros_mode](topic_name[2:])
         permission_mode = mode_mapping[dds_mode][prefix_mapping[ros_mode]]
+        yield object_type, object_name, permission_mode
+
+
+def set_rules(profile, datas, dds_mode, qualifier):
+    for object_type, object_name, permission_mode in get_rule_datas(datas, dds_mode):
         set_rule(profile, object_type, object_name, permission_mode, qualifier)
 
 
@@ -141,23 +150,333 @@ def get_profile(root, name):
         return profile
 
 
+DOMAIN_PARTICIPANTS_PATH = 'processes/value/element/domain_participants/value/element'
+
+
+def get_participant_rules(domain_participant):
+    """
+    Read the subject and endpoint rules of a domain participant.
+
+    :returns: subject name and list of ``(object_type, object_name,
+    permission_mode)`` tuples, publications first
+    """
+    subject_name = '/' + domain_participant.findtext(
+        'participant_data/participant_name/name')
+    rules = []
+    publication_datas = domain_participant.findall(
+        'publications/value/element/publication_data')
+    rules.extend(get_rule_datas(publication_datas, 'publication'))
+    subscription_datas = domain_participant.findall(
+        'subscriptions/value/element/subscription_data')
+    rules.extend(get_rule_datas(subscription_datas, 'subscription'))
+    return subject_name, rules
+
+
+class ProfileBuilder:
+    """
+    Build profiles from discovery data using dict indices.
+
+    Produces the same profiles as applying :func:`get_profile`,
+    :func:`set_attachments` and :func:`set_rule` to a ``profiles``
+    element, without scanning the tree for every endpoint. Profiles are
+    indexed by name, rules by ``(object_type, attachment, qualifier)``
+    and permissions by tag; elements are only created by :meth:`build`.
+    """
+
+    __slots__ = [
+        'profiles',
+    ]
+
+    def __init__(self):
+        # name -> (attachments, rules), insertion ordered like the tree
+        self.profiles = {}
+
+    def add_profile(self, name):
+        profile = self.profiles.get(name)
+        if profile is None:
+            profile = ({}, {})
+            self.profiles[name] = profile
+        return profile
+
+    def add_attachment(self, name, attachment):
+        self.add_profile(name)[0].setdefault(attachment)
+
+    def add_rule(self, name, object_type, object_name, permission_mode, qualifier):
+        rules = self.add_profile(name)[1]
+        permissions = rules.setdefault((object_type, object_name, qualifier), {})
+        permissions.setdefault(permission_mode)
+
+    def add_domain_participant(self, domain_participant, qualifier='ALLOW'):
+        subject_name, rules = get_participant_rules(domain_participant)
+        self.add_attachment(subject_name, subject_name)
+        for object_type, object_name, permission_mode in rules:
+            self.add_rule(subject_name, object_type, object_name, permission_mode, qualifier)
+
+    def build(self):
+        """Create the ``profiles`` element."""
+        profiles = ElementTree.Element('profiles')
+        for name, (attachments, rules) in self.profiles.items():
+            profile = ElementTree.SubElement(profiles, 'profile')
+            profile.set('name', name)
+            if attachments:
+                attachments_element = ElementTree.SubElement(profile, 'attachments')
+                for attachment in attachments:
+                    ElementTree.SubElement(attachments_element, 'attachment').text = attachment
+            for (object_type, object_name, qualifier), permissions in rules.items():
+                rule = ElementTree.SubElement(profile, object_type)
+                rule.set('qualifier', qualifier)
+                attachments_element = ElementTree.SubElement(rule, 'attachments')
+                ElementTree.SubElement(attachments_element, 'attachment').text = object_name
+                permissions_element = ElementTree.SubElement(rule, 'permissions')
+                for permission_mode in permissions:
+                    ElementTree.SubElement(permissions_element, permission_mode)
+        return profiles
+
+
 def get_profile_from_discovery(discovery):
-    profiles = ElementTree.Element('profiles')
-    domain_participants = discovery.findall(
-        'processes/value/element/domain_participants/value/element')
-    for domain_participant in domain_participants:
-        subject_name = '/' + domain_participant.findtext(
-            'participant_data/participant_name/name')
-        profile = get_profile(profiles, subject_name)
-        set_attachments(profile, subject_name)
-
-        publication_datas = domain_participant.findall(
-            'publications/value/element/publication_data')
-        set_rules(profile, publication_datas, 'publication', 'ALLOW')
-        subscription_datas = domain_participant.findall(
-            'subscriptions/value/element/subscription_data')
-        set_rules(profile, subscription_datas, 'subscription', 'ALLOW')
-
-    profiles = compress_profiles(profiles)
-    sort_profiles(profiles)
+    with stats.stage('discovery.build'):
+        builder = ProfileBuilder()
+        domain_participants = discovery.findall(DOMAIN_PARTICIPANTS_PATH)
+        for domain_participant in domain_participants:
+            builder.add_domain_participant(domain_participant)
+        profiles = builder.build()
+    stats.count('discovery.participants', len(domain_participants))
+
+    return _finish_profiles(profiles)
+
+
+def _finish_profiles(profiles):
+    with stats.stage('discovery.compress'):
+        profiles = compress_profiles(profiles)
+    with stats.stage('discovery.sort'):
+        sort_profiles(profiles)
     return profiles
+
+
+def iterparse_domain_participants(source):
+    """
+    Stream the domain participants of a discovery document.
+
+    Each participant element is yielded once it is completely parsed and
+    is detached from the document afterwards, together with every other
+    finished element, so memory use does not grow with the document.
+
+    :param source: file name or file object of the discovery XML
+    """
+    target = DOMAIN_PARTICIPANTS_PATH.split('/')
+    depth = len(target)
+    stack = []
+    path = []
+    for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if stack:
+                # the root tag is not part of the path, as with findall
+                path.append(element.tag)
+            stack.append(element)
+            continue
+        stack.pop()
+        if len(path) > depth and path[:depth] == target:
+            # part of a participant, kept until the participant ends
+            path.pop()
+            continue
+        if path == target:
+            yield element
+        if stack:
+            stack[-1].remove(element)
+            path.pop()
+
+
+def get_profile_from_discovery_file(source):
+    """
+    Build profiles from a discovery document without loading it whole.
+
+    Produces the same profiles as :func:`get_profile_from_discovery`.
+
+    :param source: file name or file object of the discovery XML
+    """
+    participants = 0
+    with stats.stage('discovery.build'):
+        builder = ProfileBuilder()
+        for domain_participant in iterparse_domain_participants(source):
+            builder.add_domain_participant(domain_participant)
+            participants += 1
+        profiles = builder.build()
+    stats.count('discovery.participants', participants)
+
+    return _finish_profiles(profiles)
+
+
+class DiscoveryDelta:
+    """
+    Changes made to the profiles of a :class:`DiscoveryMerger`.
+
+    Rules are ``(profile_name, object_type, object_name, permission_mode,
+    qualifier)`` tuples and attachments ``(profile_name, attachment)``
+    tuples. ``profiles`` holds the names of the profiles that were
+    re-emitted, including those that were removed.
+    """
+
+    __slots__ = [
+        'added_rules',
+        'removed_rules',
+        'added_attachments',
+        'removed_attachments',
+        'profiles',
+    ]
+
+    def __init__(self):
+        self.added_rules = set()
+        self.removed_rules = set()
+        self.added_attachments = set()
+        self.removed_attachments = set()
+        self.profiles = set()
+
+    def __bool__(self):
+        return bool(self.profiles)
+
+    def __str__(self):
+        data = {}
+        for attr in self.__slots__:
+            data[attr] = getattr(self, attr)
+        return str(data)
+
+
+class DiscoveryMerger:
+    """
+    Maintain the profiles of a live domain from discovery updates.
+
+    Participants are contributed either as successive snapshots, through
+    :meth:`update`, or as individual events, through
+    :meth:`add_participant` and :meth:`remove_participant`. Rules and
+    attachments are reference counted across contributions, and only the
+    profiles whose rules or attachments changed are rebuilt, compressed
+    and canonicalized. ``profiles`` is updated in place and is always
+    equal to :func:`get_profile_from_discovery` of all current
+    participants; ``fingerprints`` maps profile names to the fingerprint
+    of their canonical form.
+    """
+
+    __slots__ = [
+        'qualifier',
+        'profiles',
+        'fingerprints',
+        '_elements',
+        '_attachments',
+        '_rules',
+        '_snapshot',
+        '_participants',
+    ]
+
+    def __init__(self, qualifier='ALLOW'):
+        self.qualifier = qualifier
+        self.profiles = ElementTree.Element('profiles')
+        self.fingerprints = {}
+        self._elements = {}
+        # profile name -> number of contributing participants
+        self._attachments = Counter()
+        # profile name -> Counter of (object_type, object_name, permission_mode)
+        self._rules = {}
+        # participant contributions of the last snapshot and of events
+        self._snapshot = Counter()
+        self._participants = {}
+
+    def _contribute(self, contribution, count, before):
+        subject_name, rules = contribution
+        before.setdefault(subject_name, (
+            self._attachments[subject_name] > 0, set(self._rules.get(subject_name, ()))))
+        self._attachments[subject_name] += count
+        profile_rules = self._rules.setdefault(subject_name, Counter())
+        for rule in rules:
+            profile_rules[rule] += count
+
+    def _commit(self, before):
+        delta = DiscoveryDelta()
+        for subject_name, (attached, rules) in before.items():
+            profile_rules = self._rules[subject_name]
+            current = {rule for rule, count in profile_rules.items() if count > 0}
+            for rule in rules - current:
+                delta.removed_rules.add((subject_name,) + rule + (self.qualifier,))
+            for rule in current - rules:
+                delta.added_rules.add((subject_name,) + rule + (self.qualifier,))
+            present = self._attachments[subject_name] > 0
+            if attached and not present:
+                delta.removed_attachments.add((subject_name, subject_name))
+            elif present and not attached:
+                delta.added_attachments.add((subject_name, subject_name))
+            if rules != current or attached != present:
+                delta.profiles.add(subject_name)
+            if not present:
+                del self._attachments[subject_name]
+                del self._rules[subject_name]
+            else:
+                self._rules[subject_name] = +profile_rules
+
+        with stats.stage('discovery.emit'):
+            for subject_name in delta.profiles:
+                self._emit(subject_name)
+        stats.count('discovery.emitted_profiles', len(delta.profiles))
+        if delta:
+            # same order as canonicalize_profiles gives the profiles element
+            self.profiles[:] = [self._elements[name] for name in sorted(self._elements)]
+        return delta
+
+    def _emit(self, subject_name):
+        if subject_name not in self._attachments:
+            self._elements.pop(subject_name, None)
+            self.fingerprints.pop(subject_name, None)
+            return
+        builder = ProfileBuilder()
+        builder.add_attachment(subject_name, subject_name)
+        for object_type, object_name, permission_mode in self._rules[subject_name]:
+            builder.add_rule(
+                subject_name, object_type, object_name, permission_mode, self.qualifier)
+        profile = compress_profile(builder.build()[0])
+        self.fingerprints[subject_name] = canonicalize_profiles(profile)[profile]
+        self._elements[subject_name] = profile
+
+    def update(self, domain_participants):
+        """
+        Replace the last snapshot of participants.
+
+        :param domain_participants: iterable of domain participant elements,
+        e.g. from :func:`iterparse_domain_participants`
+        :returns: :class:`DiscoveryDelta` of the changes
+        """
+        snapshot = Counter()
+        for domain_participant in domain_participants:
+            subject_name, rules = get_participant_rules(domain_participant)
+            snapshot[(subject_name, tuple(rules))] += 1
+        before = {}
+        for contribution, count in (snapshot - self._snapshot).items():
+            self._contribute(contribution, count, before)
+        for contribution, count in (self._snapshot - snapshot).items():
+            self._contribute(contribution, -count, before)
+        self._snapshot = snapshot
+        return self._commit(before)
+
+    def add_participant(self, key, domain_participant):
+        """
+        Add or replace the participant identified by key.
+
+        :param key: hashable participant identifier, e.g. its GUID
+        :param domain_participant: domain participant element
+        :returns: :class:`DiscoveryDelta` of the changes
+        """
+        before = {}
+        if key in self._participants:
+            self._contribute(self._participants.pop(key), -1, before)
+        contribution = get_participant_rules(domain_participant)
+        self._contribute(contribution, 1, before)
+        self._participants[key] = contribution
+        return self._commit(before)
+
+    def remove_participant(self, key):
+        """
+        Remove the participant identified by key.
+
+        :raises KeyError: if no participant was added with key
+        :returns: :class:`DiscoveryDelta` of the changes
+        """
+        before = {}
+        self._contribute(self._participants.pop(key), -1, before)
+        return self._commit(before)
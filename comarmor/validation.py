@@ -0,0 +1,139 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Specialized validation of profiles against ``comarmor_profile.xsd``.
+
+:func:`is_valid_profile` mirrors the structures of the schema in plain
+Python. It only ever proves documents valid: anything it rejects or does
+not model, such as ``xml:base`` attributes or content of permission
+elements, is left to the generic schema validation, which also produces
+the error messages.
+"""
+
+import functools
+
+# sha256 of the comarmor_profile.xsd the checks below were written against
+SCHEMA_DIGEST = '7f9f532b83a8fd267df925ff8495d5edb915bf79429e7077117868af2d8c6d90'
+
+RULE_PERMISSIONS = {
+    'topic': ('publish', 'relay', 'subscribe'),
+    'ros_topic': ('ros_publish', 'ros_relay', 'ros_subscribe'),
+    'ros_service': ('ros_call', 'ros_execute'),
+}
+
+QUALIFIERS = ('ALLOW', 'DENY')
+MODIFIERS = ('AUDIT',)
+
+
+@functools.lru_cache(maxsize=None)
+def is_schema_supported(path):
+    """Return whether the schema at path is the one the checks mirror."""
+    from .cache import file_digest
+    try:
+        return file_digest(path) == SCHEMA_DIGEST
+    except OSError:
+        return False
+
+
+def _blank(text):
+    return text is None or not text.strip()
+
+
+def _element_only(element):
+    # element-only content allows whitespace between the children
+    if not _blank(element.text):
+        return False
+    for child in element:
+        if not isinstance(child.tag, str) or not _blank(child.tail):
+            return False
+    return True
+
+
+def _attachments(element):
+    if element.tag != 'attachments' or element.attrib or len(element) == 0 or \
+            not _element_only(element):
+        return False
+    for attachment in element:
+        if attachment.tag != 'attachment' or attachment.attrib or len(attachment):
+            return False
+    return True
+
+
+def _attributes(element, required):
+    attrib = element.attrib
+    for name, value in attrib.items():
+        if name == 'modifier':
+            if value not in MODIFIERS:
+                return False
+        elif name != required:
+            return False
+    return required in attrib
+
+
+def _permissions(element, allowed):
+    if element.tag != 'permissions' or element.attrib or not _element_only(element):
+        return False
+    index = 0
+    for permission in element:
+        # permissions are optional but ordered, and of xs:anyType content,
+        # which is only accepted here when empty
+        while index < len(allowed) and allowed[index] != permission.tag:
+            index += 1
+        if index == len(allowed) or permission.attrib or len(permission) or \
+                not _blank(permission.text):
+            return False
+        index += 1
+    return True
+
+
+def _rule(element):
+    allowed = RULE_PERMISSIONS[element.tag]
+    if not _attributes(element, 'qualifier') or element.get('qualifier') not in QUALIFIERS:
+        return False
+    if len(element) != 2 or not _element_only(element):
+        return False
+    return _attachments(element[0]) and _permissions(element[1], allowed)
+
+
+def _profile(element):
+    if not _attributes(element, 'name') or len(element) == 0 or not _element_only(element):
+        return False
+    if not _attachments(element[0]):
+        return False
+    for child in element[1:]:
+        if child.tag == 'profile':
+            if not _profile(child):
+                return False
+        elif child.tag in RULE_PERMISSIONS:
+            if not _rule(child):
+                return False
+        else:
+            return False
+    return True
+
+
+def is_valid_profile(root):
+    """
+    Check a ``profiles`` element against the structures of the schema.
+
+    :returns: ``True`` if the element is valid, ``False`` if it is invalid
+    or uses constructs only the generic validation handles
+    """
+    if root.tag != 'profiles' or root.attrib or len(root) == 0 or not _element_only(root):
+        return False
+    for profile in root:
+        if profile.tag != 'profile' or not _profile(profile):
+            return False
+    return True
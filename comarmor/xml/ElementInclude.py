@@ -49,6 +49,7 @@
 ##
 
 import copy
+import os
 from xml.etree import cElementTree as ElementTree
 from urllib.parse import urljoin
 
@@ -95,6 +96,106 @@ def default_loader(href, parse, encoding=None):
             data = file.read()
     return data
 
+##
+# Cache of loaded and expanded resources.  Share one instance between
+# calls to {@link include} to load and expand every resource only once,
+# e.g. tunables included by every profile of a parse run.  Entries are
+# keyed by the resolved href and the stamp (modification time, size and
+# inode) of the resource and of everything it includes.  Fragments are
+# stored and handed out as deep copies, so callers are free to modify the
+# included nodes.
+
+class IncludeCache:
+
+    def __init__(self):
+        self._fragments = {}
+        self._texts = {}
+
+    def clear(self):
+        self._fragments.clear()
+        self._texts.clear()
+
+    @staticmethod
+    def _stamp(href):
+        # same stamp as comarmor.loader.file_stamp
+        try:
+            stat = os.stat(href)
+        except (OSError, TypeError, ValueError):
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    ##
+    # Drop the entries of changed resources and of the fragments
+    # including them.
+    #
+    # @param hrefs Paths of the changed resources.
+
+    def discard(self, hrefs):
+        hrefs = {os.path.abspath(href) for href in hrefs}
+        if not hrefs:
+            return
+        for href, entry in list(self._fragments.items()):
+            if not hrefs.isdisjoint(os.path.abspath(stamped) for stamped in entry[3]):
+                del self._fragments[href]
+        for key in list(self._texts):
+            if os.path.abspath(key[0]) in hrefs:
+                del self._texts[key]
+
+    def _fresh(self, stamps):
+        for href, stamp in stamps.items():
+            if self._stamp(href) != stamp:
+                return False
+        return True
+
+    ##
+    # Look up an expanded xml fragment.
+    #
+    # @param href Resolved resource reference.
+    # @param parent_hrefs Resources currently being included.
+    # @param max_depth Remaining inclusion depth.
+    # @return A tuple of a copy of the expanded node, the hrefs it
+    #    includes and its inclusion depth, or None if the fragment
+    #    must be (re)expanded.
+
+    def get_fragment(self, href, parent_hrefs, max_depth):
+        entry = self._fragments.get(href)
+        if entry is None:
+            return None
+        node, closure, depth, stamps = entry
+        if not self._fresh(stamps):
+            del self._fragments[href]
+            return None
+        # let a full expansion report recursion and depth errors
+        if not closure.isdisjoint(parent_hrefs):
+            return None
+        if 0 <= max_depth < depth:
+            return None
+        return copy.deepcopy(node), closure, depth
+
+    def set_fragment(self, href, node, closure, depth):
+        stamps = {}
+        for dependency in {href} | closure:
+            stamp = self._stamp(dependency)
+            if stamp is None:
+                return
+            stamps[dependency] = stamp
+        self._fragments[href] = (copy.deepcopy(node), frozenset(closure), depth, stamps)
+
+    def get_text(self, href, encoding):
+        entry = self._texts.get((href, encoding))
+        if entry is None:
+            return None
+        text, stamp = entry
+        if self._stamp(href) != stamp:
+            del self._texts[(href, encoding)]
+            return None
+        return text
+
+    def set_text(self, href, encoding, text):
+        stamp = self._stamp(href)
+        if stamp is not None:
+            self._texts[(href, encoding)] = (text, stamp)
+
 ##
 # Expand XInclude directives.
 #
@@ -107,14 +208,17 @@ def default_loader(href, parse, encoding=None):
 # @param max_depth The maximum number of recursive inclusions.
 #     Limited to reduce the risk of malicious content explosion.
 #     Pass a negative value to disable the limitation.
+# @param dependencies Optional set, updated with the href of every resource
+#     loaded while expanding the tree.
+# @param cache Optional {@link IncludeCache} shared between calls.
 # @throws LimitedRecursiveIncludeError If the {@link max_depth} was exceeded.
 # @throws FatalIncludeError If the function fails to include a given
 #     resource, or if the tree contains malformed XInclude elements.
 # @throws IOError If the function fails to load a given resource.
-# @returns the node or its replacement if it was an XInclude node
+# @return The inclusion depth of the expanded tree, 0 if nothing was included.
 
 def include(elem, loader=None, base_url=None,
-            max_depth=DEFAULT_MAX_INCLUSION_DEPTH):
+            max_depth=DEFAULT_MAX_INCLUSION_DEPTH, dependencies=None, cache=None):
     if max_depth is None:
         max_depth = -1
     elif max_depth < 0:
@@ -125,10 +229,15 @@ def include(elem, loader=None, base_url=None,
     if loader is None:
         loader = default_loader
 
-    _include(elem, loader, base_url, max_depth, set())
+    return _include(elem, loader, base_url, max_depth, set(), dependencies, cache)
 
 
-def _include(elem, loader, base_url, max_depth, _parent_hrefs):
+##
+# @return The inclusion depth of the expanded element.
+
+def _include(elem, loader, base_url, max_depth, _parent_hrefs, dependencies=None,
+             cache=None):
+    height = 0
     # look for xinclude elements
     i = 0
     while i < len(elem):
@@ -139,26 +248,50 @@ def _include(elem, loader, base_url, max_depth, _parent_hrefs):
             if base_url:
                 href = urljoin(base_url, href)
             parse = e.get("parse", "xml")
+            if dependencies is not None:
+                dependencies.add(href)
             if parse == "xml":
                 if href in _parent_hrefs:
                     raise FatalIncludeError("recursive include of %s" % href)
                 if max_depth == 0:
                     raise LimitedRecursiveIncludeError(
                         "maximum xinclude depth reached when including file %s" % href)
-                _parent_hrefs.add(href)
-                node = loader(href, parse)
-                if node is None:
-                    raise FatalIncludeError(
-                        "cannot load %r as %r" % (href, parse)
-                        )
-                node = copy.copy(node)  # FIXME: this makes little sense with recursive includes
-                _include(node, loader, href, max_depth - 1, _parent_hrefs)
-                _parent_hrefs.remove(href)
+                fragment = None
+                if cache is not None:
+                    fragment = cache.get_fragment(href, _parent_hrefs, max_depth)
+                if fragment is not None:
+                    node, closure, depth = fragment
+                else:
+                    _parent_hrefs.add(href)
+                    node = loader(href, parse)
+                    if node is None:
+                        raise FatalIncludeError(
+                            "cannot load %r as %r" % (href, parse)
+                            )
+                    # the loader returns a fresh tree, a shallow copy is enough
+                    # here; cached fragments are deep copied on the way out
+                    node = copy.copy(node)
+                    closure = set()
+                    depth = 1 + _include(
+                        node, loader, href, max_depth - 1, _parent_hrefs, closure, cache)
+                    _parent_hrefs.remove(href)
+                    if cache is not None:
+                        cache.set_fragment(href, node, closure, depth)
+                if dependencies is not None:
+                    dependencies.update(closure)
+                height = max(height, depth)
                 if e.tail:
                     node.tail = (node.tail or "") + e.tail
                 elem[i] = node
             elif parse == "text":
-                text = loader(href, parse, e.get("encoding"))
+                encoding = e.get("encoding")
+                text = None
+                if cache is not None:
+                    text = cache.get_text(href, encoding)
+                if text is None:
+                    text = loader(href, parse, encoding)
+                    if text is not None and cache is not None:
+                        cache.set_text(href, encoding, text)
                 if text is None:
                     raise FatalIncludeError(
                         "cannot load %r as %r" % (href, parse)
@@ -181,5 +314,7 @@ def _include(elem, loader, base_url, max_depth, _parent_hrefs):
                 "xi:fallback tag must be child of xi:include (%r)" % e.tag
                 )
         else:
-            _include(e, loader, base_url, max_depth, _parent_hrefs)
+            height = max(height, _include(
+                e, loader, base_url, max_depth, _parent_hrefs, dependencies, cache))
         i += 1
+    return height
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 from xml.etree import cElementTree as ElementTree
 
 
@@ -29,23 +30,45 @@ def compatible_permissions(rule, compressed_rule):
     return True
 
 
+def compression_key(rule):
+    """Return the key of rules that can be merged into one, or None."""
+    if rule.tag in ('attachments', 'profile') or rule.find('attachments') is None:
+        return None
+    permissions = rule.find('permissions')
+    if permissions is not None:
+        permissions = frozenset(permission.tag for permission in permissions)
+    return rule.tag, rule.get('qualifier'), rule.get('modifier'), permissions
+
+
 def compress_profile(profile):
+    """
+    Merge the rules of a profile that only differ by their attachments.
+
+    Rules are grouped in a single pass by tag, qualifier, modifier and set
+    of permissions. The first rule of each group keeps its position and
+    receives the attachments of the others, without duplicates. Nested
+    profiles and the attachments of the profile itself are kept as is.
+    """
     compressed_profile = ElementTree.Element('profile')
     compressed_profile.set('name', profile.get('name'))
 
+    groups = {}
     for rule in list(profile):
-        compressed_rules = compressed_profile.findall(rule.tag)
-        if compressed_rules is None:
+        key = compression_key(rule)
+        if key is None:
             compressed_profile.append(rule)
-        else:
-            for compressed_rule in compressed_rules:
-                if compatible_permissions(rule, compressed_rule):
-                    attachments = rule.find('attachments')
-                    compressed_attachments = compressed_rule.find('attachments')
-                    compressed_attachments.extend(attachments)
-                    break
-            else:
-                compressed_profile.append(rule)
+            continue
+        group = groups.get(key)
+        if group is None:
+            attachments = rule.find('attachments')
+            groups[key] = (attachments, {attachment.text for attachment in attachments})
+            compressed_profile.append(rule)
+            continue
+        compressed_attachments, texts = group
+        for attachment in rule.find('attachments'):
+            if attachment.text not in texts:
+                texts.add(attachment.text)
+                compressed_attachments.append(attachment)
 
     return compressed_profile
 
@@ -88,12 +111,60 @@ def sort_by_attachment(parent):
         raise
 
 
+def _has_keys(children, key):
+    # the former per key passes were skipped when None keys made sorting fail
+    return len(children) < 2 or all(key(child) is not None for child in children)
+
+
+def _canonicalize(element, fingerprints):
+    children = list(element)
+    digests = {}
+    for child in children:
+        digests[child] = _canonicalize(child, fingerprints)
+
+    if len(children) > 1:
+        names = _has_keys(children, lambda child: child.get('name'))
+        texts = _has_keys(children, lambda child: child.text)
+        element[:] = sorted(children, key=lambda child: (
+            child.tag != 'attachments',
+            child.findtext('attachments/attachment'),
+            child.get('name') if names else '',
+            child.tag,
+            child.text if texts else '',
+            digests[child]))
+
+    digest = hashlib.sha256()
+    parts = [element.tag, (element.text or '').strip()]
+    for name, value in sorted(element.attrib.items()):
+        parts.extend((name, value))
+    for part in parts:
+        part = part.encode('utf-8')
+        digest.update(b'%d:' % len(part) + part)
+    for child in element:
+        digest.update(digests[child].encode('ascii'))
+    digest = digest.hexdigest()
+    fingerprints[element] = digest
+    return digest
+
+
+def canonicalize_profiles(profiles):
+    """
+    Sort profiles in place into canonical order and fingerprint them.
+
+    Children are sorted bottom-up with a single composite key: the
+    attachments first, then by first attachment, name, tag and text,
+    which gives the order of the former pass per key, with remaining ties
+    broken by content. The fingerprint of an element is the SHA-256 of its
+    tag, attributes, stripped text and canonically ordered children, so it
+    only changes when the profile or rule it belongs to changes.
+
+    :param profiles: ``profiles`` element to canonicalize
+    :returns: dict mapping each element of the tree to its hex fingerprint
+    """
+    fingerprints = {}
+    _canonicalize(profiles, fingerprints)
+    return fingerprints
+
+
 def sort_profiles(profiles):
-    for i in profiles.iter():
-        sort_by_text(i)
-    for i in profiles.iter():
-        sort_by_tag(i)
-    for i in profiles.iter():
-        sort_by_name(i)
-    for i in profiles.iter():
-        sort_by_attachment(i)
+    canonicalize_profiles(profiles)
@@ -12,9 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
+import re
+import sys
 from xml.dom import minidom
 from xml.etree import cElementTree as ElementTree
 
+XML_DECLARATION = '<?xml version="1.0" encoding="utf-8"?>\n'
+
+# names without namespace or prefix, which serialize as they are
+_NAME = re.compile(r'[^\W\d][\w.-]*\Z')
+# characters the minidom round-trip rejects or normalizes
+_UNSAFE_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\r\ud800-\udfff\ufffe\uffff]')
+_UNSAFE_ATTRIBUTE_CHARS = re.compile('[\t\n]')
+
 
 def tidy_xml(element):
     subiter = ElementTree.ElementTree(element).iter()
@@ -27,12 +38,137 @@ def tidy_xml(element):
     return element
 
 
-def pretty_xml(element):
+def _minidom_pretty_xml(element):
     xmlstr = ElementTree.tostring(element, encoding='unicode', method='xml')
     xmlstr = minidom.parseString(xmlstr).toprettyxml(indent='  ', newl='\n', encoding='utf-8')
     return xmlstr.decode('utf-8')
 
 
+def pretty_xml(element):
+    output = io.StringIO()
+    write_xml(element, output)
+    return output.getvalue()
+
+
+def _safe_text(text):
+    return text is None or (isinstance(text, str) and not _UNSAFE_CHARS.search(text))
+
+
+def _is_streamable(element):
+    """Return whether the streaming writer reproduces the minidom output for element."""
+    if not isinstance(element.tag, str) or not _NAME.match(element.tag):
+        return False
+    if element.tail and (not isinstance(element.tail, str) or element.tail.strip()):
+        return False
+    for node in element.iter():
+        if node.tag is ElementTree.Comment:
+            text = node.text or ''
+            if not _safe_text(text) or '--' in text or text.endswith('-'):
+                return False
+        elif not isinstance(node.tag, str) or not _NAME.match(node.tag):
+            return False
+        else:
+            for name, value in node.items():
+                if not isinstance(name, str) or not _NAME.match(name) or \
+                        not _safe_text(value) or _UNSAFE_ATTRIBUTE_CHARS.search(value):
+                    return False
+            if not _safe_text(node.text):
+                return False
+        if node is not element and not _safe_text(node.tail):
+            return False
+    return True
+
+
+def _escape_text(data):
+    data = data.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    if sys.version_info < (3, 13):
+        # minidom only stopped quoting " in text nodes with Python 3.13
+        data = data.replace('"', '&quot;')
+    return data
+
+
+def _escape_attribute(data):
+    return data.replace('&', '&amp;').replace('<', '&lt;'). \
+        replace('"', '&quot;').replace('>', '&gt;')
+
+
+def _write_element(write, element, indent, addindent):
+    if element.tag is ElementTree.Comment:
+        write('%s<!--%s-->\n' % (indent, element.text or ''))
+        return
+    write(indent + '<' + element.tag)
+    items = element.items()
+    if sys.version_info < (3, 8):
+        items = sorted(items)
+    for name, value in items:
+        write(' %s="%s"' % (name, _escape_attribute(value)))
+    text = element.text
+    if not len(element):
+        if text:
+            # a single text node is written inline
+            write('>%s</%s>\n' % (_escape_text(text), element.tag))
+        else:
+            write('/>\n')
+        return
+    write('>\n')
+    inner = indent + addindent
+    if text:
+        write(inner + _escape_text(text) + '\n')
+    for child in element:
+        _write_element(write, child, inner, addindent)
+        if child.tail:
+            write(inner + _escape_text(child.tail) + '\n')
+    write('%s</%s>\n' % (indent, element.tag))
+
+
+def write_xml(element, file):
+    """
+    Write an element indented, element by element, to a text file object.
+
+    The output is the same as :func:`pretty_xml`, i.e. as pretty printing
+    with minidom, without building the serialized document or a DOM.
+    Elements the writer cannot reproduce exactly, e.g. with namespaces or
+    processing instructions, are written through minidom instead.
+    """
+    if not _is_streamable(element):
+        file.write(_minidom_pretty_xml(element))
+        return
+    file.write(XML_DECLARATION)
+    _write_element(file.write, element, '', '  ')
+
+
+def _indent_xml(element, indent, level):
+    inner = '\n' + indent * (level + 1)
+    text = element.text.strip() if element.text else None
+    element.text = inner + text + inner if text else inner
+    for child in element:
+        if len(child):
+            _indent_xml(child, indent, level + 1)
+        elif not child.text:
+            child.text = None
+        tail = child.tail.strip() if child.tail else None
+        child.tail = inner + tail + inner if tail else inner
+    child.tail = child.tail[:-len(indent)]
+
+
+def normalize_xml(element, indent='  '):
+    """
+    Normalize whitespace of text and tails in place.
+
+    The resulting tree is the same as the one obtained by parsing the
+    output of :func:`beautify_xml`, without the serialize/reparse round-trip,
+    except for attribute values: they are kept as parsed, while the
+    round-trip replaced tabs and newlines written as character references,
+    e.g. ``&#10;``, by spaces before Python 3.13.
+    """
+    if len(element):
+        _indent_xml(element, indent, 0)
+    elif not element.text:
+        element.text = None
+    element.tail = None
+    return element
+
+
 def beautify_xml(elemnt):
     tidy_elemnt = tidy_xml(elemnt)
     pretty_elemnt = pretty_xml(tidy_elemnt)
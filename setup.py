@@ -4,7 +4,7 @@ from setuptools import setup
 setup(
     name='comarmor',
     version='0.0.0',
-    packages=find_packages(exclude=['test']),
+    packages=find_packages(exclude=['benchmark', 'test']),
     author='Ruffin White',
     author_email='ruffin@osrfoundation.org',
     maintainer='Ruffin White',
@@ -0,0 +1,95 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import os
+import pickle
+import struct
+
+import comarmor
+from comarmor.binary import dump_policy, FORMAT_VERSION, load_policy, write_policy
+from comarmor.policy import compile_policy
+import pytest
+
+PROFILES_PATH = os.path.join(os.path.dirname(__file__), 'profiles')
+
+SUBJECTS = ['/talker', '/listener', '/ns/foo', '/other', '/talkative', '/x/talker']
+KINDS = ['topic', 'ros_topic', 'ros_service']
+OBJECTS = [
+    '/chatter', '/rosout', '/rosout_agg', '/talker/secret', '/talker/x', '/foo/bar',
+    '/listener/a', '/x/talker/q', '/nope']
+PERMISSIONS = ['publish', 'subscribe', 'ros_publish', 'ros_call']
+
+
+@pytest.fixture(scope='module')
+def policy():
+    return compile_policy(comarmor.parse_profiles([PROFILES_PATH]))
+
+
+@pytest.fixture
+def policy_path(tmp_path, policy):
+    path = str(tmp_path / 'policy.bin')
+    write_policy(policy, path)
+    return path
+
+
+def get_decisions(policy):
+    return [
+        policy.check(*request)
+        for request in itertools.product(SUBJECTS, KINDS, OBJECTS, PERMISSIONS)]
+
+
+def write_file(tmp_path, data):
+    path = str(tmp_path / 'corrupt.bin')
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def test_round_trip(policy, policy_path):
+    mapped = load_policy(policy_path)
+    assert mapped.profiles == policy.profiles
+    assert list(mapped.rules) == list(policy.rules)
+    assert get_decisions(mapped) == get_decisions(policy)
+    assert 'ALLOW' in get_decisions(mapped)
+
+
+def test_pickle(policy, policy_path):
+    mapped = pickle.loads(pickle.dumps(load_policy(policy_path)))
+    assert get_decisions(mapped) == get_decisions(policy)
+
+
+def test_pickle_refuses_replaced_file(policy, policy_path):
+    data = pickle.dumps(load_policy(policy_path))
+    write_policy(policy, policy_path)
+    with pytest.raises(ValueError):
+        pickle.loads(data)
+
+
+def test_load_rejects_invalid_files(tmp_path, policy):
+    data = dump_policy(policy)
+    with pytest.raises(ValueError):
+        load_policy(write_file(tmp_path, b''))
+    with pytest.raises(ValueError):
+        load_policy(write_file(tmp_path, b'<profiles/>' * 10))
+    version = struct.pack('<H', FORMAT_VERSION + 1)
+    with pytest.raises(ValueError):
+        load_policy(write_file(tmp_path, data[:8] + version + data[10:]))
+
+
+def test_load_rejects_truncated_files(tmp_path, policy):
+    data = dump_policy(policy)
+    for size in range(len(data)):
+        with pytest.raises(ValueError):
+            load_policy(write_file(tmp_path, data[:size]))
@@ -0,0 +1,49 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+from xml.etree import cElementTree as ElementTree
+
+import comarmor
+from comarmor.cache import ProfileCache
+
+PROFILES_PATH = os.path.join(os.path.dirname(__file__), 'profiles')
+
+
+def dump(storage):
+    return [ElementTree.tostring(profile.tree.getroot()) for profile in storage]
+
+
+def test_cache_detects_replaced_include(tmp_path):
+    directory = str(tmp_path / 'comarmor.d')
+    shutil.copytree(PROFILES_PATH, directory)
+    cache = ProfileCache(str(tmp_path / 'cache'))
+    first = dump(comarmor.parse_profiles([directory], cache=cache))
+    assert dump(comarmor.parse_profiles([directory], cache=cache)) == first
+
+    # replaced with content of the same size and the old mtime, as cp -p does
+    include_path = os.path.join(directory, 'tunables', 'node.xml')
+    stat = os.stat(include_path)
+    with open(include_path) as f:
+        data = f.read().replace('/rosout', '/rosin_')
+    with open(include_path + '.tmp', 'w') as f:
+        f.write(data)
+    os.utime(include_path + '.tmp', ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(include_path + '.tmp', include_path)
+    assert os.stat(include_path).st_size == stat.st_size
+
+    second = dump(comarmor.parse_profiles([directory], cache=cache))
+    assert second != first
+    assert second == dump(comarmor.parse_profiles([directory]))
@@ -0,0 +1,133 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import random
+
+from benchmark.generate import generate_profiles
+import comarmor
+from comarmor.graph.utils import add_edges_from_profile, check_edges_from_profile
+from comarmor.graph.utils import colors, directions, IncrementalChecker
+import pytest
+
+nx = pytest.importorskip('networkx')
+
+
+@pytest.fixture(scope='module')
+def storage(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('comarmor.d'))
+    generate_profiles(directory, profiles=20, files=4, rules=10, objects=50, seed=0)
+    return comarmor.parse_profiles([directory])
+
+
+@pytest.fixture(scope='module')
+def small_storage(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('comarmor.d'))
+    generate_profiles(directory, profiles=6, files=2, rules=6, objects=20, seed=1)
+    return comarmor.parse_profiles([directory])
+
+
+def build_graph(storage, graph_class):
+    G = graph_class()
+    for profile in storage:
+        add_edges_from_profile(profile, G)
+    return G
+
+
+def get_qualifiers(G):
+    if G.is_multigraph():
+        return sorted(G.edges(keys=True, data='qualifer'))
+    return sorted(G.edges(data='qualifer'))
+
+
+def get_edges(G):
+    if G.is_multigraph():
+        return list(G.edges(keys=True, data=True))
+    return list(G.edges(data=True))
+
+
+@pytest.mark.parametrize('graph_class', [nx.MultiDiGraph, nx.DiGraph])
+def test_full_parallel_and_incremental_checks_agree(storage, graph_class):
+    full = build_graph(storage, graph_class)
+    check_edges_from_profile(storage, full)
+    parallel = build_graph(storage, graph_class)
+    check_edges_from_profile(storage, parallel, jobs=2)
+    incremental = build_graph(storage, graph_class)
+    IncrementalChecker(storage, incremental)
+
+    qualifiers = get_qualifiers(full)
+    assert qualifiers == get_qualifiers(parallel)
+    assert qualifiers == get_qualifiers(incremental)
+    assert {'allow', 'deny'} <= {edge[-1] for edge in qualifiers}
+    if full.is_multigraph():
+        # parallel edges must be qualified too, not only the first key
+        assert any(edge[2] > 0 and edge[-1] is not None for edge in qualifiers)
+
+
+def mutate_storage(rng, storage):
+    profile = rng.choice(list(storage))
+    rules = [
+        (parent, rule) for parent in profile.tree.getroot().iter('profile')
+        for rule in parent if rule.get('qualifier') is not None]
+    parent, rule = rng.choice(rules)
+    if rng.random() < 0.5:
+        parent.remove(rule)
+    else:
+        rule.set('qualifier', 'DENY' if rule.get('qualifier') == 'ALLOW' else 'ALLOW')
+    storage.mark_changed()
+
+
+def mutate_graph(rng, checker, storage, subjects, objects):
+    G = checker.G
+    operation = rng.randrange(6)
+    if operation == 0:
+        permission = rng.choice(sorted(directions))
+        u, v = directions[permission](rng.choice(subjects), rng.choice(objects))
+        # the attributes add_edges_from_profile sets, overwriting the qualification
+        checker.add_edge(u, v, label=permission, color=colors[permission])
+    elif operation == 1 and G.number_of_edges():
+        u, v = rng.choice(list(G.edges()))[:2]
+        checker.remove_edge(u, v)
+    elif operation == 2:
+        node = rng.choice(objects)
+        checker.add_node(
+            node, type='object', kind=rng.choice(['topic', 'ros_topic', 'ros_service']))
+    elif operation == 3:
+        node = rng.choice(subjects + objects)
+        if node in G:
+            checker.remove_node(node)
+    elif operation == 4:
+        mutate_storage(rng, storage)
+        checker.sync()
+    else:
+        changed = copy.deepcopy(storage)
+        mutate_storage(rng, changed)
+        checker.set_profile(changed)
+
+
+@pytest.mark.parametrize('graph_class', [nx.MultiDiGraph, nx.DiGraph])
+def test_incremental_checker_matches_full_check(small_storage, graph_class):
+    rng = random.Random(0)
+    storage = copy.deepcopy(small_storage)
+    G = build_graph(storage, graph_class)
+    subjects = sorted(n for n, v in G.nodes(data=True) if v['type'] == 'subject')
+    objects = sorted(n for n, v in G.nodes(data=True) if v['type'] == 'object')
+    checker = IncrementalChecker(storage, G)
+    for _ in range(200):
+        mutate_graph(rng, checker, checker.profile, subjects, objects)
+        expected = copy.deepcopy(G)
+        check_edges_from_profile(checker.profile, expected)
+        # the copy keeps the edge order, so the edge lists compare directly
+        assert get_edges(G) == get_edges(expected)
+        assert checker.sync() == []
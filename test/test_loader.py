@@ -0,0 +1,113 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+from xml.etree import cElementTree as ElementTree
+
+import comarmor
+from comarmor.cache import ProfileCache
+from comarmor.exceptions import InvalidProfile
+from comarmor.loader import ProfileLoader
+import pytest
+
+PROFILES_PATH = os.path.join(os.path.dirname(__file__), 'profiles')
+
+INVALID_PROFILE = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<profiles>
+    <profile name="Invalid"/>
+</profiles>
+"""
+
+
+@pytest.fixture
+def directory(tmp_path):
+    directory = str(tmp_path / 'comarmor.d')
+    shutil.copytree(PROFILES_PATH, directory)
+    return directory
+
+
+def dump(storage):
+    return [ElementTree.tostring(profile.tree.getroot()) for profile in storage]
+
+
+def replace_keeping_mtime(path, data):
+    # as cp -p or rsync -t do: a new file with the modification time of the old one
+    stat = os.stat(path)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        f.write(data)
+    os.utime(temp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(temp_path, path)
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_poll_reloads_replaced_include(tmp_path, directory, cached):
+    cache = ProfileCache(str(tmp_path / 'cache')) if cached else None
+    loader = ProfileLoader([directory], cache=cache)
+    assert loader.poll()
+    assert dump(loader.storage) == dump(comarmor.parse_profiles([directory]))
+    assert loader.poll() == []
+
+    include_path = os.path.join(directory, 'tunables', 'node.xml')
+    with open(include_path) as f:
+        data = f.read()
+    # same size, so only the inode tells the files apart
+    replace_keeping_mtime(include_path, data.replace('/rosout', '/rosin_'))
+
+    reloaded = loader.poll()
+    assert reloaded == loader.dependents(include_path)
+    expected = dump(comarmor.parse_profiles([directory]))
+    assert dump(loader.storage) == expected
+    assert b'/rosin_' in expected[0]
+    assert loader.poll() == []
+
+
+def test_invalid_profile_is_only_retried_when_changed(directory):
+    loader = ProfileLoader([directory])
+    loader.poll()
+    invalid_path = os.path.join(directory, 'invalid.xml')
+    with open(invalid_path, 'w') as f:
+        f.write(INVALID_PROFILE)
+
+    with pytest.raises(InvalidProfile):
+        loader.poll()
+    assert list(loader.errors) == [invalid_path]
+    assert loader.poll() == []
+    assert len(loader.storage) == 1
+
+    os.remove(invalid_path)
+    assert loader.poll() == [invalid_path]
+    assert loader.errors == {}
+
+
+def test_watch_reports_errors(directory):
+    invalid_path = os.path.join(directory, 'invalid.xml')
+    with open(invalid_path, 'w') as f:
+        f.write(INVALID_PROFILE)
+    errors = []
+    loader = ProfileLoader([directory])
+    watch = loader.watch(interval=0, on_error=lambda path, error: errors.append(path))
+
+    assert invalid_path in next(watch)
+    assert errors == [invalid_path]
+    assert len(loader.storage) == 1
+
+    shutil.copy(os.path.join(directory, 'example.xml'), invalid_path + '.new')
+    os.replace(invalid_path + '.new', invalid_path)
+    assert next(watch) == [invalid_path]
+    assert errors == [invalid_path]
+    assert loader.errors == {}
+    assert len(loader.storage) == 2
@@ -0,0 +1,89 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fnmatch
+import itertools
+import os
+import random
+
+import comarmor
+from comarmor.graph.utils import check_rules
+from comarmor.matcher import AttachmentMatcher
+from comarmor.policy import compile_policy
+
+PROFILES_PATH = os.path.join(os.path.dirname(__file__), 'profiles')
+
+SUBJECTS = [
+    '/talker', '/listener', '/ns/foo', '/ns/bar/baz', '/other', '/talkative', '/x/talker']
+KINDS = ['topic', 'ros_topic', 'ros_service']
+OBJECTS = [
+    '/chatter', '/rosout', '/rosout_agg', '/talker/secret', '/talker/x', '/talkative/x',
+    '/foo/bar', '/listener/a', '/x/talker/q', '/nope']
+PERMISSIONS = ['publish', 'subscribe', 'relay', 'ros_publish', 'ros_subscribe', 'ros_call']
+
+
+def filter_check(storage, subject, kind, object_name, permission):
+    """Decide a request the way check_edges_from_profile did before policies were compiled."""
+    subject_profile = storage.filter_profile(subject).findall('./profile')
+    deny_rules = subject_profile.findall('.//' + kind + '[@qualifier="DENY"]')
+    allow_rules = subject_profile.findall('.//' + kind + '[@qualifier="ALLOW"]')
+    if check_rules(deny_rules, object_name, permission):
+        return 'DENY'
+    if check_rules(allow_rules, object_name, permission):
+        return 'ALLOW'
+    return 'DENY'
+
+
+def get_requests():
+    return list(itertools.product(SUBJECTS, KINDS, OBJECTS, PERMISSIONS))
+
+
+def test_check_matches_filtered_profiles():
+    storage = comarmor.parse_profiles([PROFILES_PATH])
+    # a small cache also exercises the eviction of subject tables
+    policy = compile_policy(storage, cache_size=2)
+    decisions = set()
+    for request in get_requests():
+        decision = policy.check(*request)
+        assert decision == filter_check(storage, *request), request
+        decisions.add(decision)
+    assert decisions == {'ALLOW', 'DENY'}
+
+
+def test_check_batch_matches_check():
+    storage = comarmor.parse_profiles([PROFILES_PATH])
+    policy = compile_policy(storage)
+    requests = get_requests()
+    random.Random(0).shuffle(requests)
+    assert policy.check_batch(*zip(*requests)) == [
+        policy.check(*request) for request in requests]
+
+
+def test_attachment_matcher_matches_fnmatch():
+    rng = random.Random(0)
+    alphabet = 'ab/'
+    patterns = []
+    for _ in range(300):
+        pattern = ''.join(rng.choice(alphabet + '*?') for _ in range(rng.randint(0, 6)))
+        if rng.random() < 0.1:
+            pattern += '[ab]'
+        patterns.append(pattern)
+    matcher = AttachmentMatcher((pattern, index) for index, pattern in enumerate(patterns))
+    for _ in range(3000):
+        name = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 7)))
+        expected = [
+            index for index, pattern in enumerate(patterns)
+            if fnmatch.fnmatchcase(name, pattern)]
+        assert matcher.match_all(name) == expected, name
+        assert matcher.matches(name) == bool(expected), name
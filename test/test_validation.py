@@ -0,0 +1,123 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import os
+import random
+from xml.etree import cElementTree as ElementTree
+
+from comarmor import check_profile_schema, check_schema, ElementInclude
+from comarmor import validation
+from comarmor.exceptions import InvalidProfile
+from comarmor.schemas import get_profile_schema, get_profile_schema_path
+from comarmor.xml import utils
+import pytest
+
+PROFILE_PATH = os.path.join(os.path.dirname(__file__), 'profiles', 'example.xml')
+
+TAGS = [
+    'profiles', 'profile', 'attachments', 'attachment', 'topic', 'ros_topic', 'ros_service',
+    'permissions', 'publish', 'relay', 'subscribe', 'ros_publish', 'ros_relay',
+    'ros_subscribe', 'ros_call', 'ros_execute', 'unknown']
+
+
+def load_profile():
+    root = ElementTree.parse(PROFILE_PATH).getroot()
+    ElementInclude.include(root, base_url=PROFILE_PATH)
+    return utils.normalize_xml(root)
+
+
+def mutate(rng, root):
+    elements = list(root.iter())
+    element = rng.choice(elements)
+    mutation = rng.randrange(9)
+    if mutation == 0 and len(element):
+        del element[rng.randrange(len(element))]
+    elif mutation == 1:
+        element.tag = rng.choice(TAGS)
+    elif mutation == 2:
+        element.set(
+            rng.choice(['qualifier', 'name', 'modifier', 'unknown']),
+            rng.choice(['ALLOW', 'DENY', 'AUDIT', 'unknown']))
+    elif mutation == 3 and element.attrib:
+        del element.attrib[rng.choice(sorted(element.attrib))]
+    elif mutation == 4:
+        element.text = rng.choice([None, '  \n', 'text'])
+    elif mutation == 5 and len(element) > 1:
+        children = list(element)
+        rng.shuffle(children)
+        element[:] = children
+    elif mutation == 6:
+        element.append(copy.deepcopy(rng.choice(elements)))
+    elif mutation == 7:
+        element.tail = rng.choice([None, ' ', 'tail'])
+    elif mutation == 8 and len(element):
+        element.insert(0, copy.deepcopy(element[-1]))
+
+
+@pytest.fixture
+def unsupported_schema(monkeypatch):
+    # as if comarmor_profile.xsd had changed since the checks were written
+    monkeypatch.setattr(validation, 'SCHEMA_DIGEST', '0' * 64)
+    validation.is_schema_supported.cache_clear()
+    yield
+    validation.is_schema_supported.cache_clear()
+
+
+def test_is_valid_profile_accepts_profiles():
+    root = load_profile()
+    assert get_profile_schema().is_valid(root)
+    assert validation.is_valid_profile(root)
+
+
+def test_is_valid_profile_never_accepts_invalid_profiles():
+    schema = get_profile_schema()
+    profile = load_profile()
+    rng = random.Random(0)
+    accepted = rejected = 0
+    for _ in range(3000):
+        root = copy.deepcopy(profile)
+        for _ in range(rng.randint(1, 3)):
+            mutate(rng, root)
+        if validation.is_valid_profile(root):
+            assert schema.is_valid(root), ElementTree.tostring(root)
+            accepted += 1
+        elif not schema.is_valid(root):
+            rejected += 1
+    # the mutations exercise both outcomes
+    assert accepted > 100
+    assert rejected > 100
+
+
+def test_check_schema_reports_all_errors():
+    root = load_profile()
+    profiles = root.findall('profile')
+    profiles[0].set('qualifier', 'ALLOW')
+    profiles[1].find('attachments').tag = 'attachment'
+    with pytest.raises(InvalidProfile) as excinfo:
+        check_schema(get_profile_schema(), root, filename='example.xml')
+    message = str(excinfo.value)
+    assert "'example.xml'" in message
+    assert 'Path: /profiles/profile[1]' in message
+    assert 'Path: /profiles/profile[2]' in message
+
+
+def test_check_profile_schema_falls_back_for_changed_schema(monkeypatch, unsupported_schema):
+    root = load_profile()
+    root.find('profile').set('qualifier', 'ALLOW')
+    # a wrong accept of the fast checks must not matter once the schema changed
+    monkeypatch.setattr(validation, 'is_valid_profile', lambda root: True)
+    assert not validation.is_schema_supported(get_profile_schema_path('comarmor_profile.xsd'))
+    with pytest.raises(InvalidProfile):
+        check_profile_schema(root, fast=True)
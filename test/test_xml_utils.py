@@ -0,0 +1,119 @@
+# Copyright 2018 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import io
+import os
+import random
+from xml.etree import cElementTree as ElementTree
+
+from benchmark.generate import generate_discovery
+import comarmor
+from comarmor import ElementInclude
+from comarmor.transport.dds.rti.utils import get_profile_from_discovery
+from comarmor.xml import utils
+
+PROFILES_PATH = os.path.join(os.path.dirname(__file__), 'profiles')
+
+TEXTS = ['a', ' ', '\n', '  \n ', '&', '<', '>', '"', "'", '\xe9', '\t', '', 'x y', ']]>']
+
+
+def assert_same_output(element):
+    expected = utils._minidom_pretty_xml(element)
+    assert utils.pretty_xml(element) == expected
+    output = io.StringIO()
+    utils.write_xml(element, output)
+    assert output.getvalue() == expected
+
+
+def random_text(rng):
+    if rng.random() < 0.4:
+        return None
+    return ''.join(rng.choice(TEXTS) for _ in range(rng.randint(0, 4)))
+
+
+def random_element(rng, depth):
+    element = ElementTree.Element(rng.choice(['a', 'b_c', 'd.e', 'f-1', '\xfc']))
+    for _ in range(rng.randint(0, 3)):
+        element.set(rng.choice(['x', 'y', 'name']), random_text(rng) or '')
+    element.text = random_text(rng)
+    if depth < 4:
+        for _ in range(rng.randint(0, 3)):
+            if rng.random() < 0.1:
+                element.append(ElementTree.Comment(rng.choice(['comment', ' c ', '', 'a-b'])))
+            else:
+                element.append(random_element(rng, depth + 1))
+            element[-1].tail = random_text(rng)
+    return element
+
+
+def test_pretty_xml_of_profiles():
+    for profile in comarmor.parse_profiles([PROFILES_PATH]):
+        assert_same_output(profile.tree.getroot())
+
+
+def test_pretty_xml_of_discovery_profiles(tmp_path):
+    path = str(tmp_path / 'discovery.xml')
+    generate_discovery(path, participants=50, seed=0)
+    assert_same_output(get_profile_from_discovery(ElementTree.parse(path).getroot()))
+
+
+def test_pretty_xml_escaping():
+    root = ElementTree.Element('profile', name='say "hi" & <bye>')
+    attachment = ElementTree.SubElement(root, 'attachment')
+    attachment.text = 'say "hi" & <bye>'
+    attachment.tail = '"tail" > '
+    ElementTree.SubElement(root, 'attachment').text = "'single'"
+    assert utils._is_streamable(root)
+    assert_same_output(root)
+
+
+def test_pretty_xml_of_random_trees():
+    rng = random.Random(0)
+    streamed = 0
+    for _ in range(2000):
+        root = random_element(rng, 0)
+        root.tail = rng.choice([None, '\n', ' '])
+        assert_same_output(root)
+        streamed += utils._is_streamable(root)
+    assert streamed > 100
+
+
+def test_pretty_xml_falls_back_to_minidom():
+    elements = [
+        ElementTree.fromstring('<a xmlns="urn:test"><b/></a>'),
+        ElementTree.fromstring('<a x="1&#10;2"/>'),
+        ElementTree.fromstring('<a>&#13;</a>'),
+    ]
+    element = ElementTree.Element('a')
+    element.append(ElementTree.ProcessingInstruction('target', 'data'))
+    elements.append(element)
+    for element in elements:
+        assert not utils._is_streamable(element)
+        assert_same_output(element)
+
+
+def test_normalize_xml_matches_round_trip():
+    path = os.path.join(PROFILES_PATH, 'example.xml')
+    root = ElementTree.parse(path).getroot()
+    ElementInclude.include(root, base_url=path)
+    expected = ElementTree.fromstring(utils.beautify_xml(copy.deepcopy(root)).encode())
+    assert ElementTree.tostring(utils.normalize_xml(root)) == ElementTree.tostring(expected)
+
+
+def test_normalize_xml_keeps_attribute_values():
+    root = ElementTree.fromstring(
+        '<profiles><profile name="a&#10;b&#9;c&#13;d">text</profile></profiles>')
+    utils.normalize_xml(root)
+    assert root[0].get('name') == 'a\nb\tc\rd'